@@ -0,0 +1,276 @@
+import Executer
+import Parser
+import Simulator
+import argparse
+import json
+import numpy as np
+import os
+import pandas # imported lazily by the simulator, imported here so that no timed stage pays for it
+import pprint
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+STAGES = ["parse", "sample", "locations", "assemble", "write"]
+
+# startup checks: name, code run by a new interpreter in the repository directory ({scenario} and {dirout}
+# are a tiny scenario file and an output directory), modules it must not import, and its time budget in seconds
+# above the startup of a bare interpreter
+STARTUP_CHECKS = [("import Parser", "import Parser", ["numpy", "pandas"], 0.1),
+                  ("import Runner", "import Runner", ["pandas"], 0.3),
+                  ("main.py validate", "import main; main.validate([{scenario!r}])", ["numpy", "pandas"], 0.1),
+                  ("run csv", "import Executer; Executer.Executer.execute({scenario!r}, {dirout!r})", ["pandas"], 0.6)]
+
+class Case():
+    """
+    One point of the benchmark grid: a synthetic scenario built by make_scenario
+    """
+    def __init__(self, name, vocabulary_size=100, operation_length=4, text_size=20000, users=1, generate_commands=1,
+                 transitions=0):
+        self.name = name
+        self.vocabulary_size = vocabulary_size
+        self.operation_length = operation_length
+        self.text_size = text_size
+        self.users = users
+        self.generate_commands = generate_commands
+        self.transitions = transitions
+
+    def make_scenario(self, seed=0):
+        return make_scenario(vocabulary_size=self.vocabulary_size,
+                             operation_length=self.operation_length,
+                             text_size=self.text_size,
+                             users=self.users,
+                             generate_commands=self.generate_commands,
+                             transitions=self.transitions,
+                             seed=seed)
+
+def make_scenario(vocabulary_size, operation_length, text_size, users, generate_commands, transitions=0,
+                  alphabet_size=50, seed=0):
+    """
+    :return: a list of command dictionaries: for every user, a vocabulary of #vocabulary_size logical operations
+             of #operation_length letters with random scores (and #transitions random transitions from each one),
+             then #generate_commands texts of #text_size logical operations each, split evenly between the users
+    """
+    random_state = np.random.RandomState(seed)
+    commands = list()
+    for u in range(users):
+        user_id = "user_{}".format(u)
+        commands.append({"operation" : "add_user", "data" : {"user_id" : user_id}})
+        commands.append({"operation" : "set_session", "data" : {"user_id" : user_id, "session_id" : "S{}".format(u)}})
+        letters = random_state.randint(alphabet_size, size=(vocabulary_size, operation_length))
+        scores = random_state.randint(1, 100, size=vocabulary_size)
+        for logical_operation, score in zip(letters, scores):
+            commands.append({"operation" : "add_logical_operation",
+                             "data" : {"user_id" : user_id,
+                                       "logical_operation" : tuple("s{}".format(l) for l in logical_operation),
+                                       "score" : float(score)}})
+        if transitions:
+            logical_operations = [tuple("s{}".format(l) for l in logical_operation) for logical_operation in letters]
+            targets = random_state.randint(vocabulary_size, size=(vocabulary_size, transitions))
+            commands.append({"operation" : "add_transitions",
+                             "data" : {"user_id" : user_id,
+                                       "transitions" : [(logical_operations[i], logical_operations[j], float(k + 1))
+                                                        for i in range(vocabulary_size)
+                                                        for k, j in enumerate(targets[i])]}})
+    for g in range(generate_commands):
+        user_id = "user_{}".format(g % users)
+        commands.append({"operation" : "generate_text", "data" : {"user_id" : user_id, "text_size" : text_size}})
+    return commands
+
+def default_cases(quick=False):
+    """
+    :return: a base case, and cases varying one axis of it at a time
+    """
+    scale = 10 if quick else 1
+    base = dict(vocabulary_size=100, operation_length=4, text_size=50000 // scale, users=1, generate_commands=1)
+    axes = {"vocabulary_size" : [10, 1000],
+            "operation_length" : [2, 8],
+            "text_size" : [200000 // scale],
+            "users" : [10],
+            "generate_commands" : [20],
+            "transitions" : [5]}
+    cases = [Case("base", **base)]
+    for axis, values in axes.items():
+        for value in values:
+            params = dict(base, **{axis : value})
+            if axis == "users":
+                params["generate_commands"] = value # a text for every user, not only for user_0
+            cases.append(Case("{}={}".format(axis, value), **params))
+    return cases
+
+class StageTimer():
+    """
+    Accumulates wall time, and optionally the tracemalloc peak, of the stages of a run
+    """
+    def __init__(self, memory):
+        self.memory = memory
+        self.seconds = {stage : 0.0 for stage in STAGES}
+        self.peak_bytes = {stage : 0 for stage in STAGES}
+
+    def run(self, stage, func, *args, **kargs):
+        if self.memory:
+            tracemalloc.start()
+        b = time.perf_counter()
+        try:
+            return func(*args, **kargs)
+        finally:
+            self.seconds[stage] += time.perf_counter() - b
+            if self.memory:
+                self.peak_bytes[stage] = max(self.peak_bytes[stage], tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+
+def run_case(case, memory=True, seed=0):
+    """
+    runs the scenario of the case stage by stage. the peak memory is measured in a second run,
+    since tracemalloc slows the stages down.
+    :return: dict with per stage seconds and peak bytes, the number of tokens (letters) and tokens/sec per stage
+    """
+    timer = StageTimer(memory=False)
+    tokens = _run_stages(case, timer, seed)
+
+    result = {"tokens" : tokens,
+              "seconds" : timer.seconds,
+              "tokens_per_second" : {stage : tokens / seconds if seconds > 0 else None
+                                     for stage, seconds in timer.seconds.items()}}
+    if memory:
+        memory_timer = StageTimer(memory=True)
+        _run_stages(case, memory_timer, seed)
+        result["peak_bytes"] = memory_timer.peak_bytes
+    return result
+
+def _run_stages(case, timer, seed):
+    """
+    :return: the number of tokens (letters) generated
+    """
+    dirtmp = tempfile.mkdtemp(prefix="pa_benchmark_")
+    try:
+        filepath = os.path.join(dirtmp, "scenario")
+        with open(filepath, "w") as f:
+            f.write(pprint.pformat(case.make_scenario(seed=seed)))
+
+        parser = Parser.Parser()
+        timer.run("parse", parser.read_file, filepath)
+
+        simulator = Simulator.Simulator(seed=seed)
+        for command in parser.get_commands():
+            if not isinstance(command, Parser.command_GENERATE_TEXT_FOR_USER):
+                command.execute(simulator=simulator)
+                continue
+            user = simulator.users[command.user_id]
+            text_logical_operations = timer.run("sample", user.sample_text, command.text_size_logical_operations)
+            text_entry = timer.run("locations", user.add_text, text_logical_operations)
+            simulator.text_entries.append(text_entry)
+
+        tokens = sum(text_entry["size"] for text_entry in simulator.get_text_entries())
+        data = timer.run("assemble", Executer.Data, simulator)
+        timer.run("write", data.write, os.path.join(dirtmp, "out"))
+    finally:
+        shutil.rmtree(dirtmp, ignore_errors=True)
+    return tokens
+
+def run(cases, memory=True, seed=0):
+    results = dict()
+    for case in cases:
+        results[case.name] = run_case(case, memory=memory, seed=seed)
+        report(case.name, results[case.name])
+    return results
+
+def report(name, result):
+    print("{:<24} {:>9} tokens".format(name, result["tokens"]))
+    for stage in STAGES:
+        line = "    {:<10} {:>9.4f}s".format(stage, result["seconds"][stage])
+        if result["tokens_per_second"][stage] is not None:
+            line += " {:>14,.0f} tokens/s".format(result["tokens_per_second"][stage])
+        if "peak_bytes" in result:
+            line += " {:>10.1f} MB peak".format(result["peak_bytes"][stage] / 2**20)
+        print(line)
+
+def compare(results, baseline, tolerance, min_seconds=0.01):
+    """
+    :param tolerance: allowed relative slowdown of a stage, e.g. 0.25 for 25%
+    :param min_seconds: slowdowns smaller than this are timing noise, and are never regressions
+    :return: list of regression messages, for the cases and stages found in the baseline
+    """
+    regressions = list()
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for stage in STAGES:
+            before, after = baseline[name]["seconds"][stage], result["seconds"][stage]
+            if after > before * (1 + tolerance) and after - before > min_seconds:
+                regressions.append("{} {}: {:.4f}s -> {:.4f}s".format(name, stage, before, after))
+    return regressions
+
+def measure_startup(code, repeat=3):
+    """
+    :return: (the least wall time of #repeat runs of code by a new interpreter, the modules the last run imported)
+    """
+    dirname = os.path.dirname(os.path.abspath(__file__))
+    code += "\nimport sys\nprint()\nprint(' '.join(sys.modules))"
+    seconds = list()
+    for _ in range(repeat):
+        b = time.perf_counter()
+        process = subprocess.run([sys.executable, "-c", code], cwd=dirname, capture_output=True, text=True, check=True)
+        seconds.append(time.perf_counter() - b)
+    return min(seconds), set(process.stdout.splitlines()[-1].split())
+
+def check_startup(checks=STARTUP_CHECKS, repeat=3):
+    """
+    runs the startup checks on a tiny scenario
+    :return: list of failure messages, for the checks over budget or importing a module they must not import
+    """
+    failures = list()
+    dirtmp = tempfile.mkdtemp(prefix="pa_startup_")
+    try:
+        scenario = os.path.join(dirtmp, "scenario")
+        with open(scenario, "w") as f:
+            f.write(pprint.pformat(make_scenario(vocabulary_size=10, operation_length=4, text_size=100, users=1,
+                                                 generate_commands=1)))
+        bare, _ = measure_startup("pass", repeat=repeat)
+        print("{:<24} {:>9.4f}s".format("python", bare))
+        for name, code, forbidden, budget in checks:
+            seconds, modules = measure_startup(code.format(scenario=scenario, dirout=os.path.join(dirtmp, "out")), repeat=repeat)
+            print("{:<24} {:>9.4f}s (budget {:.4f}s)".format(name, seconds, bare + budget))
+            if seconds > bare + budget:
+                failures.append("{}: {:.4f}s over the budget of {:.4f}s".format(name, seconds, bare + budget))
+            for module in sorted(set(forbidden) & modules):
+                failures.append("{}: imports {}".format(name, module))
+    finally:
+        shutil.rmtree(dirtmp, ignore_errors=True)
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark the simulation pipeline stages")
+    parser.add_argument("--quick", action="store_true", help="smaller texts")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc (it slows the stages down)")
+    parser.add_argument("--save-baseline", metavar="PATH", help="save the results as a json baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare the results with a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--startup", action="store_true", help="only check the startup time budgets (see STARTUP_CHECKS)")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        failures = check_startup()
+        for failure in failures:
+            print("STARTUP", failure)
+        return 1 if failures else 0
+
+    results = run(default_cases(quick=args.quick), memory=not args.no_memory)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,314 @@
+"""
+Content addressed cache of scenario outputs. A run is identified by the hash of the scenario file bytes,
+the seed, the run options and the simulator code (the sources of the modules below), so editing any of them
+is a miss. On a hit the cached output files are copied to the output directory instead of simulating.
+
+    cache_dir/<key>/   the output files of one run (data, info, hist, simulation.txt, ...)
+
+Entries are used least recently first evicted, once the cache is larger than max_bytes.
+The fake TIMESTAMP column of a hit is the one of the cached run.
+
+CheckpointStore keeps simulator states at command boundaries, keyed by a hash chain over the commands, with the
+texts generated between them, so a scenario sharing a prefix of commands with a previous run resumes after the prefix
+(see Executer.execute).
+"""
+
+import hashlib
+import json
+import numpy as np
+import os
+import pickle
+import shutil
+import tempfile
+
+# the modules whose code decides the outputs
+SOURCE_MODULES = ["Simulator.py", "Parser.py", "Executer.py", "FakeColumns.py", "Outputs.py", "Table.py", "TextStore.py", "Shards.py"]
+
+_code_version = None
+
+def code_version():
+    """
+    :return: hash of the sources of SOURCE_MODULES, computed once per process
+    """
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        dirname = os.path.dirname(os.path.abspath(__file__))
+        for module in SOURCE_MODULES:
+            with open(os.path.join(dirname, module), "rb") as f:
+                digest.update(f.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+def scenario_key(filepath_in, seed, **options):
+    """
+    :param options: the run options that change the outputs (e.g. output_format), json serializable
+    :return: hex key of the run of the scenario file
+    """
+    digest = hashlib.sha256()
+    with open(filepath_in, "rb") as f:
+        for buffer in iter(lambda: f.read(1 << 20), b""):
+            digest.update(buffer)
+    digest.update(json.dumps({"seed" : seed, "options" : options, "code" : code_version()}, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+def _directory_bytes(dirpath):
+    return sum(os.path.getsize(os.path.join(root, filename))
+               for root, _, filenames in os.walk(dirpath) for filename in filenames)
+
+def _evict(entries, max_bytes, remove):
+    """
+    :param entries: list of (last use time, bytes, path), least recently used first
+    """
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in entries:
+        if total <= max_bytes:
+            break
+        remove(entry)
+        total -= size
+
+def _remove_file(filepath):
+    try:
+        os.remove(filepath)
+    except OSError:
+        pass
+
+class ResultCache():
+    def __init__(self, cache_dir, max_bytes=10 * 2**30):
+        """
+        :param max_bytes: size bound of the cache, the least recently used entries are evicted above it
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key, dirout):
+        """
+        copies the cached outputs of key to dirout
+        :return: True on a hit, False on a miss
+        """
+        entry = self.path(key)
+        if not os.path.isdir(entry):
+            return False
+        os.utime(entry) # the modification time of an entry is its last use
+        shutil.copytree(entry, dirout, dirs_exist_ok=True)
+        return True
+
+    def put(self, key, dirout):
+        """
+        stores a copy of the outputs in dirout under key, then evicts entries above max_bytes.
+        the copy is made aside and renamed, so concurrent runs never see a partial entry
+        """
+        entry = self.path(key)
+        if os.path.isdir(entry):
+            return
+        dirtmp = tempfile.mkdtemp(prefix=".tmp_", dir=self.cache_dir)
+        try:
+            shutil.copytree(dirout, dirtmp, dirs_exist_ok=True)
+            os.rename(dirtmp, entry)
+        except OSError: # another run stored the same key first
+            shutil.rmtree(dirtmp, ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        """
+        :return: list of (last use time, bytes, path) of the cache entries, least recently used first
+        """
+        entries = list()
+        for name in os.listdir(self.cache_dir):
+            entry = self.path(name)
+            if name.startswith(".tmp_") or not os.path.isdir(entry):
+                continue
+            try:
+                entries.append((os.path.getmtime(entry), _directory_bytes(entry), entry))
+            except OSError: # evicted by another run meanwhile
+                continue
+        entries.sort()
+        return entries
+
+    def evict(self):
+        _evict(self.entries(), self.max_bytes, lambda entry : shutil.rmtree(entry, ignore_errors=True))
+
+class CheckpointStore():
+    """
+    Simulator states after prefixes of a scenario's commands, and the texts the prefixes generated.
+    The key of the state after k commands is hashes[k] of chain: every key hashes the previous one and the next
+    command dictionary, so equal keys mean equal seeds, options, code and commands up to there, wherever the
+    scenarios differ afterwards.
+
+    A checkpoint is two files:
+        <key>.pkl    the pickled simulator: symbols, users vocabularies and counts, random states, no texts
+        <key>.texts  the texts generated since the previous checkpoint of the run, a stream of pickled records
+                     (see CheckpointTexts) after the key of that previous checkpoint (None for the first one)
+    So a run stores each of its texts once, however many checkpoints it saves, and the texts of a prefix
+    are read back along the chain of previous keys (see iter_texts).
+    """
+    def __init__(self, dirpath, max_bytes=10 * 2**30, min_seconds=1.0):
+        """
+        :param max_bytes: size bound of the store, the least recently used checkpoints are evicted above it
+        :param min_seconds: save a checkpoint only after this much execution time since the previous one
+                            (see Executer.execute_with_checkpoints)
+        """
+        self.dirpath = dirpath
+        self.max_bytes = max_bytes
+        self.min_seconds = min_seconds
+        os.makedirs(dirpath, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.dirpath, key + ".pkl")
+
+    def texts_path(self, key):
+        return os.path.join(self.dirpath, key + ".texts")
+
+    @staticmethod
+    def chain(seed, command_dicts, **options):
+        """
+        :return: list of len(command_dicts) + 1 keys, the key of the state after 0, 1, 2, ... commands
+        """
+        digest = hashlib.sha256(json.dumps({"seed" : seed, "options" : options, "code" : code_version()},
+                                           sort_keys=True).encode("utf-8"))
+        keys = [digest.hexdigest()]
+        for command_dict in command_dicts:
+            digest = hashlib.sha256(keys[-1].encode("utf-8"))
+            digest.update(repr(command_dict).encode("utf-8"))
+            keys.append(digest.hexdigest())
+        return keys
+
+    def _previous(self, key):
+        with open(self.texts_path(key), "rb") as f:
+            return pickle.load(f)
+
+    def run_keys(self, key):
+        """
+        :return: the keys of the checkpoints of the run up to key, first to last, or None if one was evicted
+        """
+        keys = list()
+        while key is not None:
+            if not os.path.exists(self.path(key)):
+                return None
+            try:
+                previous = self._previous(key)
+            except OSError: # evicted by another run meanwhile
+                return None
+            keys.append(key)
+            key = previous
+        keys.reverse()
+        return keys
+
+    def latest(self, keys):
+        """
+        :return: the largest k > 0 with a checkpoint of keys[k] (and of all the previous ones of its run), or 0
+        """
+        for k in range(len(keys) - 1, 0, -1):
+            if os.path.exists(self.path(keys[k])) and self.run_keys(keys[k]) is not None:
+                return k
+        return 0
+
+    def load(self, key):
+        """
+        :return: the simulator of the checkpoint, its texts are read by iter_texts
+        """
+        for run_key in self.run_keys(key): # the modification time of a checkpoint is its last use
+            os.utime(self.path(run_key))
+        with open(self.path(key), "rb") as f:
+            return pickle.load(f)
+
+    def iter_texts(self, key):
+        """
+        :return: generator of the text entries generated up to the checkpoint, in order
+        """
+        for run_key in self.run_keys(key):
+            with open(self.texts_path(run_key), "rb") as f:
+                pickle.load(f) # the previous key
+                yield from _iter_pickles(f)
+
+    def open_texts(self, previous):
+        """
+        :param previous: key of the previous checkpoint of the run (the one resumed from), None if there is none
+        :return: CheckpointTexts collecting the texts of the next checkpoint
+        """
+        return CheckpointTexts(self.dirpath, previous)
+
+    def save(self, key, simulator, texts):
+        """
+        writes the checkpoint of key, with the texts collected since the previous one.
+        both files are written aside and renamed, the texts first, so concurrent runs never load a partial checkpoint
+        :param simulator: with no text entries left (they are in texts)
+        :param texts: the CheckpointTexts of open_texts, closed by save
+        """
+        assert not simulator.text_entries, "the text entries are saved in texts, flush them first"
+        texts.close()
+        if os.path.exists(self.path(key)):
+            _remove_file(texts.tmppath)
+            return
+        os.replace(texts.tmppath, self.texts_path(key))
+        fd, tmppath = tempfile.mkstemp(prefix=".tmp_", dir=self.dirpath)
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(simulator, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmppath, self.path(key))
+        self.evict()
+
+    def entries(self):
+        """
+        :return: list of (last use time, bytes, key) of the checkpoints, least recently used first
+        """
+        entries = list()
+        for name in os.listdir(self.dirpath):
+            if name.startswith(".tmp_") or not name.endswith(".pkl"):
+                continue
+            key = name[:-len(".pkl")]
+            try:
+                entries.append((os.path.getmtime(self.path(key)),
+                                os.path.getsize(self.path(key)) + os.path.getsize(self.texts_path(key)), key))
+            except OSError: # evicted by another run meanwhile
+                continue
+        entries.sort()
+        return entries
+
+    def evict(self):
+        """
+        evicts the least recently used checkpoints above max_bytes. a checkpoint whose run lost an earlier one
+        is not loaded anymore (see latest), and is evicted in its turn
+        """
+        def remove(key):
+            _remove_file(self.path(key))
+            _remove_file(self.texts_path(key))
+        _evict(self.entries(), self.max_bytes, remove)
+
+class CheckpointTexts():
+    """
+    The texts of a run since its previous checkpoint, appended to a temporary file of the store
+    as they are generated, until CheckpointStore.save names it after the checkpoint
+    """
+    fields = ["user_id", "session_id", "size", "text", "letters_logical_operations", "lo_index"]
+
+    def __init__(self, dirpath, previous):
+        fd, self.tmppath = tempfile.mkstemp(prefix=".tmp_", dir=dirpath)
+        self.file = os.fdopen(fd, "wb")
+        pickle.dump(previous, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def append(self, text_entry):
+        """
+        :param text_entry: a text entry of the simulator, only its ids arrays are kept (as for a TextStore)
+        """
+        record = {field : text_entry[field] for field in self.fields}
+        for field in ["text", "letters_logical_operations", "lo_index"]:
+            record[field] = np.asarray(record[field])
+        pickle.dump(record, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def close(self):
+        self.file.close()
+
+    def discard(self):
+        self.close()
+        _remove_file(self.tmppath)
+
+def _iter_pickles(f):
+    while True:
+        try:
+            yield pickle.load(f)
+        except EOFError:
+            return
@@ -1,7 +1,15 @@
+import Cache
 import Simulator
 import Parser
-import pandas as pd
+import FakeColumns
+import Instrumentation
+import Outputs
+import Table
+import numpy as np
 import time
+import concurrent.futures
+import copy
+import itertools
 import os
 import shutil
 
@@ -15,8 +23,20 @@ def time_wrapper(func, msg, end = " "):
     return w_func
 
 class Executer():
-    def __init__(self):
-        self.simulator = Simulator.Simulator()
+    def __init__(self, writer=None, seed=0, per_user_streams=False, workers=1, store=None, retention=Simulator.RETAIN_ALL):
+        """
+        :param workers: number of processes sampling consecutive generate_text commands concurrently.
+                        more than 1 requires per_user_streams, and gives the same texts as 1 worker
+        :param store: directory of a TextStore, to keep the generated texts on disk (see Simulator)
+        :param retention: what the simulator keeps of the generated texts (see Simulator.RETENTIONS)
+        """
+        assert workers >= 1
+        assert workers == 1 or per_user_streams, "parallel generation requires per_user_streams"
+        self.simulator = Simulator.Simulator(seed=seed, per_user_streams=per_user_streams, store=store, retention=retention)
+        self.writer = writer # optional DataWriter, text entries are streamed to it after every command
+        self.checkpoint_texts = None # Cache.CheckpointTexts the streamed entries are saved to (see execute_with_checkpoints)
+        self.workers = workers
+        self._pool = None
 
     def execute_commands(self, commands):
         """
@@ -26,94 +46,388 @@ class Executer():
         assert type(commands) is list
         assert all([isinstance(command, Parser.Command) for command in commands])
         print("executing {} commands".format(len(commands)))
+        self.execute_iter(commands)
+
+    def execute_iter(self, commands):
+        """
+        :param commands: an iterable of commands objects (e.g. Parser.iter_file), executed as they come.
+                         repeat commands are expanded lazily, one iteration at a time
+        :return: the number of executed commands
+        """
+        commands = Parser.expand_commands(commands)
+        count = 0
+        if self.workers == 1:
+            for command in commands:
+                self._execute_command(command, index=count)
+                count += 1
+            return count
+
+        # consecutive generate_text commands are independent: they are sampled together by the pool
+        generate_commands = list()
+        for command in itertools.chain(commands, [None]):
+            if isinstance(command, Parser.command_GENERATE_TEXT_FOR_USER):
+                generate_commands.append(command)
+                continue
+            if generate_commands:
+                requests = [(c.user_id, c.text_size_logical_operations) for c in generate_commands]
+                with Instrumentation.stage("generate_texts", record=True, command_index=count, commands=len(requests)) as record:
+                    begin = len(self.simulator.get_text_entries())
+                    self.simulator.generate_texts_for_users(requests, executor=self._get_pool())
+                    record["tokens"] = self._tokens_since(begin)
+                    self._flush()
+                count += len(generate_commands)
+                generate_commands = list()
+            if command is not None:
+                self._execute_command(command, index=count)
+                count += 1
+        return count
+
+    def _execute_command(self, command, index):
+        with Instrumentation.stage(command._class_operation(), record=True, command_index=index) as record:
+            record["tokens"] = 0
+            begin = len(self.simulator.get_text_entries())
+            for _ in command.iter_execute(simulator = self.simulator): # bulk commands flush after every user
+                record["tokens"] += self._tokens_since(begin)
+                self._flush()
+                begin = len(self.simulator.get_text_entries())
+
+    def _tokens_since(self, begin):
+        """
+        :return: the number of letters in the text entries generated after the first #begin ones
+        """
+        return sum(text_entry["size"] for text_entry in self.simulator.get_text_entries()[begin:])
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _flush(self):
+        """
+        hands the text entries generated so far to the writer (if any) and drops them from the simulator
+        """
+        if self.writer is None:
+            return
+        text_entries = self.simulator.iter_text_entries(flush=True)
+        if self.checkpoint_texts is not None:
+            text_entries = self._checkpointed(text_entries)
+        self.writer.write_entries(text_entries)
 
-        for command in commands:
-            command.execute(simulator = self.simulator)
+    def _checkpointed(self, text_entries):
+        for text_entry in text_entries:
+            self.checkpoint_texts.append(text_entry)
+            yield text_entry
 
     def execute_from_file(self, filepath):
+        """
+        streams the commands of the file: every command is executed right after it is parsed
+        """
+        print("reading commands from file: ", filepath)
         parser = Parser.Parser()
-        parser.read_file(filepath)
-        commands = parser.get_commands()
-        self.execute_commands(commands)
+        count = self.execute_iter(Instrumentation.timed_iter("parse", parser.iter_file(filepath)))
+        print("executed {} commands".format(count))
 
-    @staticmethod
-    def execute(filepath_in, dirout):
+    def execute_with_checkpoints(self, filepath, checkpoints, **options):
+        """
+        executes the commands of the file, resuming from the checkpoint of the longest prefix of them
+        already executed (by any scenario): the texts of the prefix are read back from the checkpoints and
+        written first, then the next commands are executed. the commands run one at a time, whatever the number of workers
+        :param checkpoints: Cache.CheckpointStore
+        :param options: the options which change the simulation, they are part of the checkpoints keys
+        """
+        assert self.writer is not None, "the texts are streamed to the writer and the checkpoints"
+        print("reading commands from file: ", filepath)
+        parser = Parser.Parser()
+        with Instrumentation.stage("parse"):
+            commands = list(Parser.expand_commands(parser.iter_file(filepath)))
+        keys = checkpoints.chain(self.simulator.seed, [command.cmd for command in commands], **options)
 
-        executer = __class__()
-        executer.execute_from_file(filepath_in)
+        begin = checkpoints.latest(keys)
+        if begin > 0:
+            with Instrumentation.stage("checkpoint_load", record=True, command_index=begin):
+                simulator = checkpoints.load(keys[begin])
+                simulator.set_store(self.simulator.store)
+                self.simulator = simulator
+                self.writer.symbols = simulator.symbols
+                self.writer.write_entries(checkpoints.iter_texts(keys[begin]))
+            print("resuming after {} of {} commands".format(begin, len(commands)))
 
+        self.checkpoint_texts = checkpoints.open_texts(keys[begin] if begin > 0 else None)
+        try:
+            last_checkpoint = time.perf_counter()
+            for index in range(begin, len(commands)):
+                self._execute_command(commands[index], index=index)
+                if index == len(commands) - 1 or time.perf_counter() - last_checkpoint >= checkpoints.min_seconds:
+                    with Instrumentation.stage("checkpoint_save", command_index=index + 1):
+                        checkpoints.save(keys[index + 1], self.simulator, self.checkpoint_texts)
+                        self.checkpoint_texts = checkpoints.open_texts(keys[index + 1])
+                    last_checkpoint = time.perf_counter()
+        finally:
+            self.checkpoint_texts.discard()
+            self.checkpoint_texts = None
+        print("executed {} commands".format(len(commands) - begin))
+
+    @staticmethod
+    def execute(filepath_in, dirout, seed=0, per_user_streams=False, workers=1, report=None, output_format="csv",
+                store=None, cache_dir=None, checkpoint_dir=None, shards=None, pipelined=False):
+        """
+        :param report: Instrumentation.Report collecting the stages timings, written to report.json in dirout.
+                       default: a new report, profiling the stages named in the environment (see Instrumentation)
+        :param output_format: format of the data, info and hist outputs: csv, parquet, feather or npy (see Outputs)
+        :param store: directory of a TextStore, to keep the generated texts on disk instead of RAM
+        :param cache_dir: directory of a Cache.ResultCache. when the same scenario ran with the same seed, options
+                          and code, its cached outputs are copied to dirout instead of simulating again
+        :param checkpoint_dir: directory of a Cache.CheckpointStore. the simulation resumes after the longest prefix
+                               of the commands already executed, whose texts are read back from the checkpoints
+        :param shards: split the users into this many shards, simulated by local processes and merged (see Shards).
+                       the outputs are the same as with per_user_streams
+        :param pipelined: generate, assemble and write the outputs concurrently (see DataWriter)
+        """
         os.makedirs(dirout,exist_ok=True)
         shutil.copy(filepath_in, os.path.join(dirout, "simulation.txt"))
 
-        Data.make(simulator=executer.simulator,
-                  dirout=dirout)
+        cache, key, hit = None, None, False
+        if cache_dir is not None:
+            cache = Cache.ResultCache(cache_dir)
+            key = Cache.scenario_key(filepath_in, seed, per_user_streams=per_user_streams or shards is not None,
+                                     output_format=getattr(output_format, "__name__", output_format))
+
+        if report is None:
+            report = Instrumentation.Report(dirprofile=dirout)
+        with report.activate(), Instrumentation.stage("execute", record=True, scenario=filepath_in, seed=seed, workers=workers) as record:
+            if cache is not None:
+                with Instrumentation.stage("cache"):
+                    hit = cache.get(key, dirout)
+                record["cache"] = "hit" if hit else "miss"
+            if hit:
+                print("reusing the cached outputs of {} (seed {})".format(filepath_in, seed))
+            elif shards is not None:
+                import Shards # Shards imports this module
+                Shards.run_local(filepath_in, dirout, shards, seed=seed, output_format=output_format)
+            else:
+                # the texts are streamed to the writer, the simulator needs only the counts for hist
+                executer = __class__(seed=seed, per_user_streams=per_user_streams, workers=workers, store=store,
+                                     retention=Simulator.RETAIN_COUNTS)
+                try:
+                    executer.writer = DataWriter(dirout=dirout, symbols=executer.simulator.symbols, output_format=output_format,
+                                                 pipelined=pipelined)
+                    if checkpoint_dir is None:
+                        executer.execute_from_file(filepath_in)
+                    else:
+                        executer.execute_with_checkpoints(filepath_in, Cache.CheckpointStore(checkpoint_dir),
+                                                          per_user_streams=per_user_streams)
+                    executer.writer.close(histogram=executer.simulator.get_histogram_table())
+                except BaseException:
+                    if executer.writer is not None: # no threads or open files are left behind by a failed scenario
+                        executer.writer.abort()
+                    raise
+                finally:
+                    executer.close()
+        report.write(os.path.join(dirout, "report.json"))
+        if cache is not None and not hit:
+            cache.put(key, dirout)
 Executer.execute = time_wrapper(Executer.execute,  msg = "Exec")
 
 class Data():
-    def __init__(self, simulator):
+    """
+    The whole output of a simulator at once. The data and info tables are assembled from the text entries arrays,
+    and written as csv without pandas; df, df_locations and histogram build the DataFrames when asked for.
+    """
+    def __init__(self, simulator, fake_columns=None):
+        self.symbols = simulator.symbols
+        self.fake_columns = FakeColumns.default_fake_columns() if fake_columns is None else fake_columns
+        # the fake columns keep state between chunks: every output written later starts from a copy of them unused
+        self._unused_fake_columns = copy.deepcopy(self.fake_columns)
         self.text_entries = simulator.get_text_entries()
-        self.histogram = simulator.get_histogram()
+        self.histogram_table = simulator.get_histogram_table()
         self._set_df()
 
     def _set_df(self):
-        if len(self.text_entries) == 0:
-            return pd.DataFrame([])
+        with Instrumentation.stage("assemble", tokens=sum(text_entry["size"] for text_entry in self.text_entries)):
+            self._assemble()
+
+    def _assemble(self):
+        sizes = [text_entry["size"] for text_entry in self.text_entries]
+        size = sum(sizes)
+
+        def concatenate(key):
+            arrays = [np.asarray(text_entry[key]) for text_entry in self.text_entries]
+            return np.concatenate(arrays) if arrays else np.zeros(0, dtype=np.int32)
+
+        def repeat(key):
+            return np.repeat(Simulator._object_array([text_entry[key] for text_entry in self.text_entries]), sizes)
+
+        letters = self.symbols.decode_letters(concatenate("text"))
+        data_table = Table.Table({"ACCESS_ID" : repeat("user_id"),
+                                  "SESSION_ID" : repeat("session_id"),
+                                  "CONSTRUCT_ID" : letters}, size)
+        self.data_table = __class__._add_fake_columns(data_table, fake_columns=self.fake_columns)
 
-        locations = list()
-        dfs = list()
-        for text_entry in self.text_entries:
-            size = text_entry["size"]
-            cur_df = pd.DataFrame(index=range(size)) # setting size to duplicate user_id and session_id
-            cur_df["ACCESS_ID"] = text_entry["user_id"]
-            cur_df["SESSION_ID"] = text_entry["session_id"]
-            cur_df["CONSTRUCT_ID"] = pd.Series(text_entry["text"], dtype=str)
+        text_index = np.arange(size, dtype=np.int64)
+        self.info_table = Table.Table({"logical_operation" : self.symbols.decode_logical_operations(concatenate("letters_logical_operations")),
+                                       "text" : letters,
+                                       "text_index" : text_index,
+                                       "lo_index" : concatenate("lo_index").astype(np.int64)}, size, index=text_index)
 
-            dfs.append(cur_df)
+    @property
+    def df(self):
+        return self.data_table.to_frame()
 
-            locations.append(text_entry["locations_full"])
+    @property
+    def df_locations(self):
+        return self.info_table.to_frame()
 
-        df = pd.concat(dfs, ignore_index=True)
-        df = df[["ACCESS_ID", "SESSION_ID", "CONSTRUCT_ID"]]
-        df = __class__._add_fake_columns(df)
-        self.df = df
+    @property
+    def histogram(self):
+        return self.histogram_table.to_frame()
 
-        self.df_locations = pd.concat(locations, ignore_index=True)
-        self.df_locations["text_index"] = self.df_locations.index
+    columns = ["RECORD_TYPE","SESSION_ID","CONSTRUCT_ID","TIMESTAMP","full_sql_id","unix_timestamp","ACCESS_ID","tenant_id","config_id","global_id","full_sql"]
 
     @staticmethod
-    def _add_fake_columns(df):
-        datetime_format = "%Y-%m-%d %H:%M:%S"
-        gen_time = lambda i: time.strftime(datetime_format, time.localtime(time.time() + i))
-        gen_full_sql_id = lambda i : i
-        gen_unix_timestamp = lambda i : "unix_timestamp{}".format(i)
-
-        def series(gen_function, n, dtype):
-            return pd.Series([gen_function(i) for i in range(n)], dtype = dtype)
-
-        df["TIMESTAMP"] = series(gen_time, len(df), dtype=str)
-        df["full_sql_id"] = series(gen_full_sql_id, len(df), dtype=int)
-        df["unix_timestamp"] = series(gen_unix_timestamp, len(df), dtype=str)
-        df["RECORD_TYPE"] = "PA"
-        df["tenant_id"] = "1"
-        df["config_id"] = "2"
-        df["global_id"] = "3"
-        df["full_sql"] = "4"
-
-        # adjust columns order
-        columns = ["RECORD_TYPE","SESSION_ID","CONSTRUCT_ID","TIMESTAMP","full_sql_id","unix_timestamp","ACCESS_ID","tenant_id","config_id","global_id","full_sql"]
+    def _add_fake_columns(df, offset=0, fake_columns=None):
+        """
+        :param df: a DataFrame or a Table.Table of the simulated columns
+        :param offset: the global line number of the first row of df, when df is a chunk of the data
+        :param fake_columns: list of FakeColumns.FakeColumn, defaults to FakeColumns.default_fake_columns()
+        """
+        if fake_columns is None:
+            fake_columns = FakeColumns.default_fake_columns()
+
+        for fake_column in fake_columns:
+            df[fake_column.name] = fake_column.generate(df, offset)
+
+        # adjust columns order, columns which are not in Data.columns go last
+        columns = __class__.columns + [c for c in df.columns if c not in __class__.columns]
         df = df[columns]
         return df
 
-    def write(self, dirout):
-        print("writing data ({} lines) to directory {}".format(len(self.df), dirout))
+    def write(self, dirout, output_format="csv"):
+        """
+        :param output_format: csv, or a columnar format of Outputs (written from the text entries by a DataWriter)
+        """
+        if output_format != "csv":
+            writer = DataWriter(dirout=dirout, symbols=self.symbols, fake_columns=copy.deepcopy(self._unused_fake_columns),
+                                output_format=output_format)
+            writer.write_entries(self.text_entries)
+            writer.close(histogram=self.histogram_table)
+            return
+
+        print("writing data ({} lines) to directory {}".format(len(self.data_table), dirout))
         os.makedirs(dirout, exist_ok=True)
 
-        self.df.to_csv(          os.path.join(dirout, "data.csv"), index=False,header=False)
-        self.df_locations.to_csv(os.path.join(dirout, "info.csv".format(dirout)))
-        self.histogram.to_csv(   os.path.join(dirout, "hist.csv".format(dirout)))
+        with Instrumentation.stage("write", tokens=len(self.data_table)):
+            self.data_table.to_csv(     os.path.join(dirout, "data.csv"), index=False,header=False)
+            self.info_table.to_csv(     os.path.join(dirout, "info.csv"))
+            self.histogram_table.to_csv(os.path.join(dirout, "hist.csv"))
 
     @staticmethod
-    def make(simulator, dirout):
-        data_obj = __class__(simulator=simulator)
-        data_obj.write(dirout=dirout)
-        # print(data_obj.df)
\ No newline at end of file
+    def make(simulator, dirout, fake_columns=None, output_format="csv"):
+        data_obj = __class__(simulator=simulator, fake_columns=fake_columns)
+        data_obj.write(dirout=dirout, output_format=output_format)
+        # print(data_obj.df)
+
+class Chunk():
+    """
+    Lines [begin, end) of a text entry, starting at global line number offset of the output.
+    The backends (see Outputs) read its id arrays, or the decoded data.csv / info.csv tables (or frames).
+    The decoding arrays are taken when the chunk is made: a pipelined backend decodes on another thread,
+    while the simulator goes on interning symbols (see Outputs.PipelinedBackend)
+    """
+    def __init__(self, text_entry, begin, end, offset, symbols, fake_columns):
+        self.user_id = text_entry["user_id"]
+        self.session_id = text_entry["session_id"]
+        self.size = end - begin
+        self.offset = offset
+        self.symbols = symbols
+        self.fake_columns = fake_columns
+        self.letters_array = symbols.decoding_array("letters")
+        self.logical_operations_array = symbols.decoding_array("logical_operations")
+
+        self.letters = text_entry["text"][begin:end]
+        self.logical_operations = text_entry["letters_logical_operations"][begin:end]
+        self.lo_index = text_entry["lo_index"][begin:end]
+
+    def decode_letters(self):
+        return self.letters_array[np.asarray(self.letters, dtype=np.int64)]
+
+    def decode_logical_operations(self):
+        return self.logical_operations_array[np.asarray(self.logical_operations, dtype=np.int64)]
+
+    def text_index(self):
+        return np.arange(self.offset, self.offset + self.size, dtype=np.int64)
+
+    def data_table(self):
+        table = Table.Table({"ACCESS_ID" : self.user_id,
+                             "SESSION_ID" : self.session_id,
+                             "CONSTRUCT_ID" : self.decode_letters()}, self.size)
+        return Data._add_fake_columns(table, offset=self.offset, fake_columns=self.fake_columns)
+
+    def info_table(self):
+        index = self.text_index()
+        return Table.Table({"logical_operation" : self.decode_logical_operations(),
+                            "text" : self.decode_letters(),
+                            "text_index" : index,
+                            "lo_index" : self.lo_index}, self.size, index=index)
+
+    def data_frame(self):
+        return self.data_table().to_frame()
+
+    def info_frame(self):
+        return self.info_table().to_frame()
+
+class DataWriter():
+    """
+    Streams text entries to the output files, in chunks of at most chunk_size lines,
+    so the memory used for writing is bounded regardless of the total text size.
+    With the csv output format the files are the same as Data.write; hist.csv is written on close.
+    """
+    def __init__(self, dirout, symbols, chunk_size=100000, fake_columns=None, output_format="csv", pipelined=False):
+        """
+        :param output_format: csv, parquet, feather or npy (see Outputs), or an Outputs.OutputBackend class
+        :param pipelined: assemble and write the chunks in background threads (see Outputs.PipelinedBackend),
+                          overlapping them with the generation of the next texts
+        """
+        assert chunk_size > 0
+        self.dirout = dirout
+        self.symbols = symbols
+        self.fake_columns = FakeColumns.default_fake_columns() if fake_columns is None else fake_columns
+        self.chunk_size = chunk_size
+        self.lines = 0
+        self.backend = Outputs.make_backend(output_format, dirout, pipelined=pipelined)
+
+    def write_entries(self, text_entries):
+        """
+        :param text_entries: iterable of text entries (e.g. Simulator.get_text_entries(), or a generator)
+        """
+        for text_entry in text_entries:
+            self.write_entry(text_entry)
+
+    def write_entry(self, text_entry):
+        with Instrumentation.stage("write", tokens=text_entry["size"]):
+            self._write_entry(text_entry)
+
+    def _write_entry(self, text_entry):
+        for begin in range(0, text_entry["size"], self.chunk_size):
+            end = min(begin + self.chunk_size, text_entry["size"])
+            self.backend.write_chunk(Chunk(text_entry, begin, end, offset=self.lines,
+                                           symbols=self.symbols, fake_columns=self.fake_columns))
+            self.lines += end - begin
+
+    def close(self, histogram):
+        """
+        :param histogram: the simulator's histogram (Simulator.get_histogram_table() or get_histogram())
+        """
+        print("writing data ({} lines) to directory {}".format(self.lines, self.dirout))
+        with Instrumentation.stage("write_histogram"):
+            self.backend.close(histogram=histogram, symbols=self.symbols)
+
+    def abort(self):
+        """
+        closes the files of the output, when the simulation failed (see Outputs.OutputBackend.abort)
+        """
+        self.backend.abort()
@@ -0,0 +1,105 @@
+import numpy as np
+import time
+
+class FakeColumn():
+    """
+    A column of data.csv that is not simulated (timestamps, ids, constants).
+    generate returns the values of a whole chunk of lines at once, so no python code runs per line.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def generate(self, df, offset):
+        """
+        :param df: the chunk of data, a Table.Table (or a DataFrame) with the simulated columns (ACCESS_ID, SESSION_ID, CONSTRUCT_ID)
+        :param offset: the global line number of the first line of df
+        :return: a scalar or an array of len(df) values
+        """
+        raise NotImplementedError
+
+class ConstantColumn(FakeColumn):
+    def __init__(self, name, value):
+        super().__init__(name)
+        self.value = value
+
+    def generate(self, df, offset):
+        return self.value
+
+class CounterColumn(FakeColumn):
+    """
+    the global line number, optionally as a string with a prefix (e.g. unix_timestamp17)
+    """
+    def __init__(self, name, prefix=None):
+        super().__init__(name)
+        self.prefix = prefix
+
+    def generate(self, df, offset):
+        counter = np.arange(offset, offset + len(df), dtype=np.int64)
+        if self.prefix is None:
+            return counter
+        return np.char.add(self.prefix, counter.astype(str))
+
+class TimestampColumn(FakeColumn):
+    """
+    local time strings, one line every step seconds starting at start (default: the time of the first chunk).
+    session_gap seconds are added whenever SESSION_ID changes between consecutive lines,
+    and a uniform random jitter in [0, jitter) seconds is added to each line.
+    """
+    def __init__(self, name, start=None, step=1, session_gap=0, jitter=0, seed=0):
+        super().__init__(name)
+        self.start = start
+        self.step = step
+        self.session_gap = session_gap
+        self.jitter = jitter
+        self.random_state = np.random.default_rng(seed) # own generator, the simulation's random state is untouched
+
+        self._last_session = None
+        self._gaps = 0 # number of session changes seen in the previous chunks
+
+    def generate(self, df, offset):
+        if self.start is None:
+            self.start = time.time()
+
+        seconds = self.start + np.arange(offset, offset + len(df), dtype=np.float64) * self.step
+
+        if self.session_gap and len(df) > 0:
+            sessions = np.asarray(df["SESSION_ID"])
+            changes = np.empty(len(df), dtype=np.int64)
+            changes[0] = self._last_session is not None and sessions[0] != self._last_session
+            changes[1:] = sessions[1:] != sessions[:-1]
+            gaps = self._gaps + np.cumsum(changes)
+            seconds += gaps * self.session_gap
+            self._gaps = int(gaps[-1])
+            self._last_session = sessions[-1]
+
+        if self.jitter:
+            seconds += self.random_state.uniform(0, self.jitter, size=len(df))
+
+        return format_local_time(seconds)
+
+def format_local_time(seconds):
+    """
+    :param seconds: array of unix times
+    :return: array of "%Y-%m-%d %H:%M:%S" strings in local time.
+             the utc offset of the first value is used for the whole array
+    """
+    seconds = np.floor(np.asarray(seconds, dtype=np.float64)).astype(np.int64)
+    if len(seconds) == 0:
+        return np.array([], dtype=str)
+    utc_offset = time.localtime(int(seconds[0])).tm_gmtoff
+    local = (seconds + utc_offset).astype("datetime64[s]")
+    return np.char.replace(local.astype(str), "T", " ")
+
+def default_fake_columns():
+    """
+    :return: a new list of the columns Data adds to data.csv.
+             columns can keep state between chunks (e.g. TimestampColumn), so use a new list for every output
+    """
+    return [TimestampColumn("TIMESTAMP"),
+            CounterColumn("full_sql_id"),
+            CounterColumn("unix_timestamp", prefix="unix_timestamp"),
+            ConstantColumn("RECORD_TYPE", "PA"),
+            ConstantColumn("tenant_id", "1"),
+            ConstantColumn("config_id", "2"),
+            ConstantColumn("global_id", "3"),
+            ConstantColumn("full_sql", "4")]
@@ -0,0 +1,156 @@
+"""
+Per stage timing of a run. Code marks its stages with
+
+    with Instrumentation.stage("write", tokens=n):
+        ...
+
+which costs almost nothing unless a Report is active (see Report.activate).
+Every stage adds its wall time, cpu time and token count to the report totals of its name;
+stages opened with record=True (the commands, the whole execution) are also kept one by one.
+
+Profiling is opt-in, per stage name, without editing code:
+    PA_SIMULATOR_CPROFILE=write,generate_text   dumps cProfile stats of these stages next to the report
+    PA_SIMULATOR_TRACEMALLOC=parse              records the tracemalloc peak and top allocations of these stages
+"all" selects every stage.
+"""
+
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+try:
+    import resource
+except ImportError: # not available on windows
+    resource = None
+
+CPROFILE_ENV = "PA_SIMULATOR_CPROFILE"
+TRACEMALLOC_ENV = "PA_SIMULATOR_TRACEMALLOC"
+
+_active = None # the Report stages are recorded to
+
+def _names_from_env(variable):
+    return {name.strip() for name in os.environ.get(variable, "").split(",") if name.strip()}
+
+def max_rss_bytes():
+    """
+    :return: the memory high-water mark of this process, or None where it is unknown
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024 # kilobytes on linux
+
+class Report():
+    def __init__(self, dirprofile=None, cprofile=None, tracemalloc_stages=None):
+        """
+        :param dirprofile: directory for the cProfile dumps
+        :param cprofile: names of the stages to run under cProfile, default from PA_SIMULATOR_CPROFILE
+        :param tracemalloc_stages: names of the stages to trace with tracemalloc, default from PA_SIMULATOR_TRACEMALLOC
+        """
+        self.dirprofile = dirprofile
+        self.cprofile = _names_from_env(CPROFILE_ENV) if cprofile is None else set(cprofile)
+        self.tracemalloc_stages = _names_from_env(TRACEMALLOC_ENV) if tracemalloc_stages is None else set(tracemalloc_stages)
+
+        self.records = list()
+        self.totals = dict()
+        self._profiles = 0 # number of cProfile dumps, to name them
+        self._profiling = False
+
+    @contextlib.contextmanager
+    def activate(self):
+        global _active
+        previous, _active = _active, self
+        try:
+            yield self
+        finally:
+            _active = previous
+
+    def _selected(self, names, name):
+        return name in names or "all" in names
+
+    @contextlib.contextmanager
+    def stage(self, name, record=False, **info):
+        entry = dict(info, stage=name)
+
+        profile = None
+        if self._selected(self.cprofile, name) and not self._profiling: # nested stages are in the outer profile
+            profile = cProfile.Profile()
+            self._profiling = True
+        trace = self._selected(self.tracemalloc_stages, name) and not tracemalloc.is_tracing()
+        if trace:
+            tracemalloc.start()
+
+        b_wall, b_cpu = time.perf_counter(), time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield entry
+        finally:
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+            entry["wall_seconds"] = time.perf_counter() - b_wall
+            entry["cpu_seconds"] = time.process_time() - b_cpu
+
+            if trace:
+                entry["tracemalloc_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+                statistics = tracemalloc.take_snapshot().statistics("lineno")[:10]
+                entry["tracemalloc_top"] = [str(statistic) for statistic in statistics]
+                tracemalloc.stop()
+            if profile is not None:
+                entry["cprofile"] = self._dump_profile(profile, name)
+
+            self._add(entry, record)
+
+    def _dump_profile(self, profile, name):
+        dirprofile = self.dirprofile if self.dirprofile is not None else "."
+        os.makedirs(dirprofile, exist_ok=True)
+        filepath = os.path.join(dirprofile, "profile_{}_{}.prof".format(name, self._profiles))
+        self._profiles += 1
+        profile.dump_stats(filepath)
+        return filepath
+
+    def _add(self, entry, record):
+        total = self.totals.setdefault(entry["stage"], {"count" : 0, "wall_seconds" : 0.0, "cpu_seconds" : 0.0, "tokens" : 0})
+        total["count"] += 1
+        total["wall_seconds"] += entry["wall_seconds"]
+        total["cpu_seconds"] += entry["cpu_seconds"]
+        total["tokens"] += entry.get("tokens") or 0
+        if record:
+            entry["max_rss_bytes"] = max_rss_bytes()
+            self.records.append(entry)
+
+    def to_dict(self):
+        return {"totals" : self.totals,
+                "records" : self.records,
+                "max_rss_bytes" : max_rss_bytes()}
+
+    def write(self, filepath):
+        with open(filepath, "w") as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+
+def stage(name, record=False, **info):
+    """
+    :return: a context manager timing the stage in the active report, or doing nothing when there is none.
+             it yields a dict, where the stage can add information (e.g. tokens) to its record
+    """
+    if _active is None:
+        return contextlib.nullcontext(dict())
+    return _active.stage(name, record=record, **info)
+
+def timed_iter(name, iterable):
+    """
+    yields the items of iterable, adding the time spent producing each one to the stage totals
+    (e.g. parsing the next command of a streamed scenario)
+    """
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
@@ -0,0 +1,324 @@
+"""
+Output backends of DataWriter. A backend receives the output chunk by chunk (see Executer.Chunk)
+and stores data, info and hist in its own format:
+    csv     - data.csv, info.csv, hist.csv (the original format)
+    parquet - data.parquet, info.parquet, hist.parquet and logical_operations.parquet (needs pyarrow)
+    feather - the same tables as arrow ipc files *.feather (needs pyarrow)
+    npy     - integer ids as .npy arrays (np.load(..., mmap_mode="r") maps them) plus vocabulary.json
+The columnar formats keep the logical operations as ids into the logical_operations table,
+instead of a stringified tuple per line. The csv and npy backends do not use pandas (see Table).
+
+A backend handles a chunk in two steps: assemble (build the frames, tables or bytes, cpu bound)
+and write (append them to the files, io bound). PipelinedBackend runs the two steps of any backend
+in their own threads, so generating the texts, assembling and writing overlap.
+"""
+
+import json
+import numpy as np
+import os
+import queue
+import threading
+import Instrumentation
+import Table
+
+class OutputBackend():
+    def __init__(self, dirout):
+        self.dirout = dirout
+        os.makedirs(dirout, exist_ok=True)
+
+    def path(self, filename):
+        return os.path.join(self.dirout, filename)
+
+    def write_chunk(self, chunk):
+        self.write(self.assemble(chunk))
+
+    def assemble(self, chunk):
+        """
+        :return: what write needs to append the chunk to the files
+        """
+        raise NotImplementedError
+
+    def write(self, assembled):
+        raise NotImplementedError
+
+    def close(self, histogram, symbols):
+        """
+        :param histogram: the simulator's histogram, a Table.Table or a DataFrame (Simulator.get_histogram_table())
+        :param symbols: the simulator's SymbolTable, the vocabulary the chunks ids refer to
+        """
+        raise NotImplementedError
+
+    def abort(self):
+        """
+        closes the files of an output which will not be finished (e.g. the simulation failed), without close's outputs
+        """
+        pass
+
+class CsvBackend(OutputBackend):
+    info_columns = ["logical_operation", "text", "text_index", "lo_index"]
+
+    def __init__(self, dirout):
+        super().__init__(dirout)
+        self.data_file = open(self.path("data.csv"), "w", newline="")
+        self.info_file = open(self.path("info.csv"), "w", newline="")
+        Table.Table({name : [] for name in self.info_columns}, 0).to_csv(self.info_file)
+
+    def assemble(self, chunk):
+        return (chunk.data_table().to_csv(index=False, header=False),
+                chunk.info_table().to_csv(header=False))
+
+    def write(self, assembled):
+        data, info = assembled
+        self.data_file.write(data)
+        self.info_file.write(info)
+
+    def close(self, histogram, symbols):
+        self.data_file.close()
+        self.info_file.close()
+        histogram.to_csv(self.path("hist.csv"))
+
+    def abort(self):
+        self.data_file.close()
+        self.info_file.close()
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.feather
+    except ImportError:
+        raise ImportError("the parquet and feather outputs need pyarrow (pip install pyarrow)")
+    return pyarrow
+
+def _info_columnar_frame(chunk):
+    import pandas as pd
+    return pd.DataFrame({"logical_operation_id" : chunk.logical_operations,
+                         "text" : chunk.decode_letters(),
+                         "text_index" : chunk.text_index(),
+                         "lo_index" : chunk.lo_index})
+
+def _logical_operations_frame(symbols):
+    import pandas as pd
+    return pd.DataFrame({"logical_operation_id" : np.arange(len(symbols.logical_operations), dtype=np.int32),
+                         "logical_operation" : [list(lo) for lo in symbols.logical_operations]})
+
+def _histogram_frame(histogram):
+    if isinstance(histogram, Table.Table):
+        histogram = histogram.to_frame()
+    histogram = histogram.reset_index(drop=True)
+    histogram["logical_operation"] = [list(lo) for lo in histogram["logical_operation"]]
+    return histogram
+
+class ArrowBackend(OutputBackend):
+    """
+    writes every table as a stream of arrow record batches, one batch per chunk
+    """
+    extension = None
+
+    def __init__(self, dirout):
+        super().__init__(dirout)
+        self.pyarrow = _import_pyarrow()
+        self.writers = dict()
+
+    def _open(self, filepath, schema):
+        raise NotImplementedError
+
+    def _table(self, df):
+        return self.pyarrow.Table.from_pandas(df, preserve_index=False)
+
+    def _write(self, name, table):
+        if name not in self.writers:
+            self.writers[name] = self._open(self.path("{}.{}".format(name, self.extension)), table.schema)
+        self.writers[name].write_table(table)
+
+    def assemble(self, chunk):
+        return {"data" : self._table(chunk.data_frame()),
+                "info" : self._table(_info_columnar_frame(chunk))}
+
+    def write(self, assembled):
+        for name, table in assembled.items():
+            self._write(name, table)
+
+    def close(self, histogram, symbols):
+        self._write("logical_operations", self._table(_logical_operations_frame(symbols)))
+        self._write("hist", self._table(_histogram_frame(histogram)))
+        for writer in self.writers.values():
+            writer.close()
+
+    def abort(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = dict()
+
+class ParquetBackend(ArrowBackend):
+    extension = "parquet"
+
+    def _open(self, filepath, schema):
+        return self.pyarrow.parquet.ParquetWriter(filepath, schema)
+
+class FeatherBackend(ArrowBackend):
+    extension = "feather"
+
+    def _open(self, filepath, schema):
+        return self.pyarrow.ipc.new_file(filepath, schema)
+
+class NpyBackend(OutputBackend):
+    """
+    data_<column>.npy and info_<column>.npy integer arrays, one value per line of data.csv / info.csv:
+        data_ACCESS_ID, data_SESSION_ID  indices into vocabulary.json users / sessions
+        data_CONSTRUCT_ID                letter ids, indices into vocabulary.json letters
+        info_logical_operation           logical operation ids, indices into vocabulary.json logical_operations
+        info_lo_index                    index of the letter in its logical operation
+    text_index and full_sql_id are the line numbers, and the fake columns are not stored.
+    the arrays are appended to raw files while writing, and turned into .npy files on close.
+    """
+    columns = {"data_ACCESS_ID" : np.int32,
+               "data_SESSION_ID" : np.int32,
+               "data_CONSTRUCT_ID" : np.int32,
+               "info_logical_operation" : np.int32,
+               "info_lo_index" : np.int32}
+
+    def __init__(self, dirout):
+        super().__init__(dirout)
+        self.files = {name : open(self.path(name + ".raw"), "wb") for name in self.columns}
+        self.lines = 0
+        self.users = dict()
+        self.sessions = dict()
+
+    def _index(self, values, value):
+        return values.setdefault(value, len(values))
+
+    def assemble(self, chunk):
+        user = self._index(self.users, chunk.user_id)
+        session = self._index(self.sessions, chunk.session_id)
+        arrays = {"data_ACCESS_ID" : np.full(chunk.size, user),
+                  "data_SESSION_ID" : np.full(chunk.size, session),
+                  "data_CONSTRUCT_ID" : chunk.letters,
+                  "info_logical_operation" : chunk.logical_operations,
+                  "info_lo_index" : chunk.lo_index}
+        return chunk.size, {name : np.ascontiguousarray(array, dtype=self.columns[name]).tobytes()
+                            for name, array in arrays.items()}
+
+    def write(self, assembled):
+        size, buffers = assembled
+        for name, buffer in buffers.items():
+            self.files[name].write(buffer)
+        self.lines += size
+
+    def close(self, histogram, symbols, buffer_size=1 << 24):
+        for name, f in self.files.items():
+            f.close()
+            raw_path = self.path(name + ".raw")
+            dtype = np.dtype(self.columns[name])
+            with open(self.path(name + ".npy"), "wb") as out, open(raw_path, "rb") as raw:
+                np.lib.format.write_array_header_1_0(out, {"descr" : np.lib.format.dtype_to_descr(dtype),
+                                                           "fortran_order" : False,
+                                                           "shape" : (self.lines,)})
+                while True:
+                    buffer = raw.read(buffer_size)
+                    if not buffer:
+                        break
+                    out.write(buffer)
+            os.remove(raw_path)
+
+        vocabulary = {"letters" : symbols.letters,
+                      "logical_operations" : [list(lo) for lo in symbols.logical_operations],
+                      "users" : list(self.users),
+                      "sessions" : list(self.sessions),
+                      "lines" : self.lines}
+        with open(self.path("vocabulary.json"), "w") as f:
+            json.dump(vocabulary, f)
+        _histogram_frame(histogram).to_json(self.path("hist.json"), orient="records")
+
+    def abort(self):
+        for f in self.files.values():
+            f.close()
+
+_DONE = object() # the end of the chunks in the queues of PipelinedBackend
+
+class PipelinedBackend():
+    """
+    Runs the assemble and write steps of a backend in two threads, connected to the caller and to each other
+    by queues of at most queue_size chunks, so the memory held by the pipeline is bounded.
+    The chunks are written in order. An error of a thread is raised in the caller, by write_chunk or close.
+    abort stops the threads without handling the chunks left in the queues.
+    """
+    def __init__(self, backend, queue_size=4):
+        self.backend = backend
+        self.dirout = backend.dirout
+        self.chunks = queue.Queue(maxsize=queue_size)
+        self.assembled = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.aborted = False
+        self.threads = [threading.Thread(target=self._run, args=(self.chunks, self.assembled, backend.assemble, "assemble_chunks"),
+                                         name="assemble", daemon=True),
+                        threading.Thread(target=self._run, args=(self.assembled, None, backend.write, "write_chunks"),
+                                         name="write", daemon=True)]
+        for thread in self.threads:
+            thread.start()
+
+    def _run(self, source, target, step, stage):
+        while True:
+            item = source.get()
+            running = self.error is None and not self.aborted
+            if item is not _DONE and running:
+                try:
+                    with Instrumentation.stage(stage):
+                        item = step(item)
+                except BaseException as e:
+                    self.error = e
+            if target is not None and (item is _DONE or (running and self.error is None)):
+                target.put(item)
+            if item is _DONE:
+                return
+
+    def _raise(self):
+        if self.error is not None:
+            raise self.error
+
+    def write_chunk(self, chunk):
+        self._raise()
+        self.chunks.put(chunk)
+
+    def close(self, histogram, symbols):
+        """
+        waits for the chunks in the pipeline to be written, then closes the backend
+        """
+        self.chunks.put(_DONE)
+        for thread in self.threads:
+            thread.join()
+        self._raise()
+        self.backend.close(histogram, symbols)
+
+    def abort(self):
+        self.aborted = True
+        if self.threads[0].is_alive(): # else close already sent the end of the chunks
+            self.chunks.put(_DONE)
+        for thread in self.threads:
+            thread.join()
+        self.backend.abort()
+
+BACKENDS = {"csv" : CsvBackend,
+            "parquet" : ParquetBackend,
+            "feather" : FeatherBackend,
+            "npy" : NpyBackend}
+
+def make_backend(output_format, dirout, pipelined=False):
+    """
+    :param output_format: a name in BACKENDS, or an OutputBackend class
+    :param pipelined: wrap the backend in a PipelinedBackend
+    """
+    if isinstance(output_format, str):
+        assert output_format in BACKENDS, "unknown output format {}, use one of {}".format(output_format, list(BACKENDS))
+        output_format = BACKENDS[output_format]
+    backend = output_format(dirout)
+    return PipelinedBackend(backend) if pipelined else backend
+
+def read_npy(dirout):
+    """
+    :return: (dict of the memory mapped arrays of an npy output, the vocabulary dict)
+    """
+    with open(os.path.join(dirout, "vocabulary.json")) as f:
+        vocabulary = json.load(f)
+    arrays = {name : np.load(os.path.join(dirout, name + ".npy"), mmap_mode="r") for name in NpyBackend.columns}
+    return arrays, vocabulary
@@ -1,22 +1,50 @@
-import Simulator
+import ast
+import itertools
+import json
+import re
+import Instrumentation
 
 class Command():
-    def __init__(self, cmd):
+    """
+    A parsed command dictionary {"operation": ..., "data": ...}. The subclasses keep the parsed fields in __slots__.
+    The validation runs over a list of dictionaries at once (see validate and Parser.make_commands).
+    """
+    __slots__ = ("cmd",)
+    data_keys = None # the keys of cmd["data"], None when _validate_datas checks them
+
+    def __init__(self, cmd, validate=True):
+        """
+        :param validate: False when cmd was already validated (see Parser.make_commands)
+        """
         self.cmd = cmd
-        self._validate()
+        if validate:
+            self.validate([cmd])
         self._parse()
 
     @staticmethod
     def _class_operation():
         pass
 
-    def _validate(self):
+    @classmethod
+    def validate(cls, cmds):
         """
-        validates that cmd is indeed belong to this specific class
+        validates that every cmd of the list indeed belongs to this specific class
         """
-        assert type(self.cmd) is dict
-        assert self.cmd.keys() == {"operation","data"}
-        assert self.cmd["operation"] == self._class_operation()
+        operation = cls._class_operation()
+        assert all(type(cmd) is dict and cmd.keys() == {"operation", "data"} and cmd["operation"] == operation
+                   and type(cmd["data"]) is dict for cmd in cmds), "invalid {} command".format(operation)
+        datas = [cmd["data"] for cmd in cmds]
+        if cls.data_keys is not None:
+            assert all(data.keys() == cls.data_keys for data in datas), \
+                "the data keys of {} are {}".format(operation, sorted(cls.data_keys))
+        cls._validate_datas(datas)
+
+    @staticmethod
+    def _validate_datas(datas):
+        """
+        checks the values of the data dictionaries of a list of commands of this class
+        """
+        pass
 
     def _parse(self):
         pass
@@ -24,14 +52,21 @@ class Command():
     def execute(self, simulator):
         pass
 
+    def iter_execute(self, simulator):
+        """
+        executes the command step by step, yielding after every step, so the caller can stream out
+        the texts generated so far. most commands are a single step
+        """
+        self.execute(simulator)
+        yield
+
 class command_ADD_USER(Command):
+    __slots__ = ("user_id",)
+    data_keys = {"user_id"}
+
     @staticmethod
     def _class_operation():
         return "add_user"
-    def _validate(self):
-        super()._validate()
-
-        assert self.cmd["data"].keys() == {"user_id"}
 
     def _parse(self):
         data = self.cmd["data"]
@@ -41,14 +76,13 @@ class command_ADD_USER(Command):
         simulator.add_user(self.user_id)
 
 class command_SET_USER_SESSION(Command):
+    __slots__ = ("user_id", "session_id")
+    data_keys = {"user_id", "session_id"}
+
     @staticmethod
     def _class_operation():
         return "set_session"
 
-    def _validate(self):
-        super()._validate()
-        assert self.cmd["data"].keys() == {"user_id", "session_id"}
-
     def _parse(self):
         data = self.cmd["data"]
         self.user_id = data["user_id"]
@@ -58,16 +92,17 @@ class command_SET_USER_SESSION(Command):
                                    session_id=self.session_id)
 
 class command_ADD_LOGICAL_OPERATION(Command):
+    __slots__ = ("user_id", "logical_operation", "score")
+    data_keys = {"user_id", "logical_operation", "score"}
+
     @staticmethod
     def _class_operation():
         return "add_logical_operation"
 
-    def _validate(self):
-        super()._validate()
-        data = self.cmd["data"]
-        assert data.keys() == {"user_id", "logical_operation", "score"}
-        assert type(data["logical_operation"]) is tuple
-        assert type(data["score"]) is float
+    @staticmethod
+    def _validate_datas(datas):
+        assert all(type(data["logical_operation"]) is tuple for data in datas)
+        assert all(type(data["score"]) is float for data in datas)
 
     def _parse(self):
         data = self.cmd["data"]
@@ -81,42 +116,41 @@ class command_ADD_LOGICAL_OPERATION(Command):
                                                score=self.score)
 
 class command_ADD_LOGICAL_OPERATIONS(Command):
+    __slots__ = ("user_id", "logical_operations", "score")
+    data_keys = {"user_id", "logical_operations", "score"}
+
     @staticmethod
     def _class_operation():
         return "add_logical_operations"
 
-    def _validate(self):
-        super()._validate()
-        data = self.cmd["data"]
-        assert data.keys() == {"user_id", "logical_operations", "score"}
-        assert type(data["logical_operations"]) is list # list of tuples, one tuple for one logical operation
-        assert all(type(lo) is tuple for lo in data["logical_operations"])
-        assert type(data["score"]) is float
+    @staticmethod
+    def _validate_datas(datas):
+        assert all(type(data["logical_operations"]) is list for data in datas) # list of tuples, one tuple for one logical operation
+        assert all(type(lo) is tuple for data in datas for lo in data["logical_operations"])
+        assert all(type(data["score"]) is float for data in datas)
 
     def _parse(self):
         data = self.cmd["data"]
         self.user_id = data["user_id"]
-        self.logical_operations = list(data["logical_operations"])
-        self.logical_operations = [tuple(l) for l in self.logical_operations]
+        self.logical_operations = [tuple(l) for l in data["logical_operations"]]
         self.score = float(data["score"])
 
     def execute(self, simulator):
-        for logical_operation in self.logical_operations:
-            simulator.add_logical_opration_to_user(user_id = self.user_id,
-                                                   logical_operation=logical_operation,
-                                                   score=self.score)
+        simulator.add_logical_operations_to_user(user_id = self.user_id,
+                                                 logical_operations=self.logical_operations,
+                                                 scores=[self.score] * len(self.logical_operations))
 
 class command_DELETE_LOGICAL_OPERATION(Command):
+    __slots__ = ("user_id", "logical_operation")
+    data_keys = {"user_id", "logical_operation"}
+
     @staticmethod
     def _class_operation():
         return "delete_logical_operation"
 
-    def _validate(self):
-        super()._validate()
-
-        data = self.cmd["data"]
-        assert data.keys() == {"user_id", "logical_operation"}
-        assert type(data["logical_operation"]) is tuple
+    @staticmethod
+    def _validate_datas(datas):
+        assert all(type(data["logical_operation"]) is tuple for data in datas)
 
     def _parse(self):
         data = self.cmd["data"]
@@ -128,38 +162,88 @@ class command_DELETE_LOGICAL_OPERATION(Command):
                                                   logical_operation=self.logical_operation)
 
 class command_DELETE_LOGICAL_OPERATIONS(Command):
+    __slots__ = ("user_id", "logical_operations")
+    data_keys = {"user_id", "logical_operations"}
+
     @staticmethod
     def _class_operation():
         return "delete_logical_operations"
 
-    def _validate(self):
-        super()._validate()
-
-        data = self.cmd["data"]
-        assert data.keys() == {"user_id", "logical_operations"}
-        assert type(data["logical_operations"]) is list # list of tuples, one tuple for one logical operation
-        assert all(type(lo) is tuple for lo in data["logical_operations"])
+    @staticmethod
+    def _validate_datas(datas):
+        assert all(type(data["logical_operations"]) is list for data in datas) # list of tuples, one tuple for one logical operation
+        assert all(type(lo) is tuple for data in datas for lo in data["logical_operations"])
 
     def _parse(self):
         data = self.cmd["data"]
         self.user_id = data["user_id"]
-        self.logical_operations = list(data["logical_operations"])
-        self.logical_operations = [tuple(l) for l in self.logical_operations]
+        self.logical_operations = [tuple(l) for l in data["logical_operations"]]
 
     def execute(self, simulator):
         for logical_operation in self.logical_operations:
             simulator.del_logical_operation_from_user(user_id=self.user_id,
                                                       logical_operation=logical_operation)
 
-class command_GENERATE_TEXT_FOR_USER(Command):
+class command_ADD_TRANSITIONS(Command):
+    __slots__ = ("user_id", "transitions")
+    data_keys = {"user_id", "transitions"}
+
     @staticmethod
     def _class_operation():
-        return "generate_text"
-    def _validate(self):
-        super()._validate()
+        return "add_transitions"
 
+    @staticmethod
+    def _validate_datas(datas):
+        assert all(type(data["transitions"]) is list for data in datas) # list of (from logical operation, to logical operation, score)
+        assert all(type(transition) is tuple and len(transition) == 3
+                   and type(transition[0]) is tuple and type(transition[1]) is tuple and type(transition[2]) is float
+                   for data in datas for transition in data["transitions"])
+
+    def _parse(self):
         data = self.cmd["data"]
-        assert data.keys() == {"user_id", "text_size"}
+        self.user_id = data["user_id"]
+        self.transitions = [(tuple(from_lo), tuple(to_lo), float(score)) for from_lo, to_lo, score in data["transitions"]]
+
+    def execute(self, simulator):
+        for from_logical_operation, to_logical_operation, score in self.transitions:
+            simulator.add_transition_to_user(user_id=self.user_id,
+                                             from_logical_operation=from_logical_operation,
+                                             to_logical_operation=to_logical_operation,
+                                             score=score)
+
+class command_DELETE_TRANSITIONS(Command):
+    __slots__ = ("user_id", "transitions")
+    data_keys = {"user_id", "transitions"}
+
+    @staticmethod
+    def _class_operation():
+        return "delete_transitions"
+
+    @staticmethod
+    def _validate_datas(datas):
+        assert all(type(data["transitions"]) is list for data in datas) # list of (from logical operation, to logical operation)
+        assert all(type(transition) is tuple and len(transition) == 2
+                   and type(transition[0]) is tuple and type(transition[1]) is tuple
+                   for data in datas for transition in data["transitions"])
+
+    def _parse(self):
+        data = self.cmd["data"]
+        self.user_id = data["user_id"]
+        self.transitions = [(tuple(from_lo), tuple(to_lo)) for from_lo, to_lo in data["transitions"]]
+
+    def execute(self, simulator):
+        for from_logical_operation, to_logical_operation in self.transitions:
+            simulator.del_transition_from_user(user_id=self.user_id,
+                                               from_logical_operation=from_logical_operation,
+                                               to_logical_operation=to_logical_operation)
+
+class command_GENERATE_TEXT_FOR_USER(Command):
+    __slots__ = ("user_id", "text_size_logical_operations")
+    data_keys = {"user_id", "text_size"}
+
+    @staticmethod
+    def _class_operation():
+        return "generate_text"
 
     def _parse(self):
         data = self.cmd["data"]
@@ -170,6 +254,163 @@ class command_GENERATE_TEXT_FOR_USER(Command):
         simulator.generate_text_for_user(user_id=self.user_id,
                                          text_size_logical_operations=self.text_size_logical_operations)
 
+def _substitute(value, name, i):
+    """
+    :return: value with "{name}" replaced by i in all its strings (recursively in dicts, lists and tuples)
+    """
+    if type(value) is str:
+        return value.replace("{" + name + "}", str(i))
+    if type(value) is dict:
+        return {_substitute(k, name, i) : _substitute(v, name, i) for k, v in value.items()}
+    if type(value) in [list, tuple]:
+        return type(value)(_substitute(v, name, i) for v in value)
+    return value
+
+def _validate_users(users):
+    """
+    users of add_users and generate_population: either {"user_ids": [...]},
+    or {"prefix": str, "count": int} for the ids prefix0, prefix1, ... (the numbers start at "start", default 0).
+    an optional "session_id" is set to every user, with "{i}" replaced by the user's number (index in user_ids)
+    """
+    assert type(users) is dict
+    if "user_ids" in users:
+        assert users.keys() <= {"user_ids", "session_id"}
+        assert type(users["user_ids"]) is list
+    else:
+        assert {"prefix", "count"} <= users.keys() <= {"prefix", "count", "start", "session_id"}
+        assert type(users["prefix"]) is str
+        assert type(users["count"]) is int and users["count"] >= 0
+        assert type(users.get("start", 0)) is int
+    assert type(users.get("session_id", "")) is str
+
+def _iter_users(users):
+    """
+    :return: generator of (user_id, session_id or None) of the users description (see _validate_users)
+    """
+    session_id = users.get("session_id")
+    if "user_ids" in users:
+        numbered = enumerate(users["user_ids"])
+    else:
+        start = users.get("start", 0)
+        numbered = ((i, users["prefix"] + str(i)) for i in range(start, start + users["count"]))
+    for i, user_id in numbered:
+        yield user_id, None if session_id is None else _substitute(session_id, "i", i)
+
+class command_ADD_USERS(Command):
+    __slots__ = ("users",)
+
+    @staticmethod
+    def _class_operation():
+        return "add_users"
+
+    @staticmethod
+    def _validate_datas(datas):
+        for data in datas:
+            _validate_users(data)
+
+    def _parse(self):
+        self.users = self.cmd["data"]
+
+    def execute(self, simulator):
+        simulator.add_users(_iter_users(self.users))
+
+class command_GENERATE_POPULATION(Command):
+    """
+    many users with vocabularies drawn from one template, e.g.
+    {"operation": "generate_population",
+     "data": {"users": {"prefix": "user_", "count": 10000, "session_id": "S{i}"},
+              "logical_operations": [("a", "b"), ("c",), ...],
+              "vocabulary_size": 20,
+              "scores": {"distribution": "zipf", "a": 1.2},
+              "text_size": 100}}
+    see Simulator.iter_population. the users are expanded one at a time while executing.
+    """
+    __slots__ = ("users", "logical_operations", "options")
+    optional_keys = {"vocabulary_size", "scores", "text_size", "seed"}
+
+    @staticmethod
+    def _class_operation():
+        return "generate_population"
+
+    @staticmethod
+    def _validate_datas(datas):
+        optional_keys = command_GENERATE_POPULATION.optional_keys
+        for data in datas:
+            assert {"users", "logical_operations"} <= data.keys() <= {"users", "logical_operations"} | optional_keys
+            _validate_users(data["users"])
+            assert type(data["logical_operations"]) is list
+            assert all(type(lo) is tuple for lo in data["logical_operations"])
+            assert type(data.get("scores", dict())) is dict
+
+    def _parse(self):
+        data = self.cmd["data"]
+        self.users = data["users"]
+        self.logical_operations = [tuple(lo) for lo in data["logical_operations"]]
+        self.options = {key : data[key] for key in self.optional_keys if key in data}
+
+    def execute(self, simulator):
+        for _ in self.iter_execute(simulator):
+            pass
+
+    def iter_execute(self, simulator):
+        return simulator.iter_population(_iter_users(self.users), self.logical_operations, **self.options)
+
+class command_REPEAT(Command):
+    """
+    the block of commands #times times, with "{i}" (or "{<var>}") in their strings replaced by the iteration number, e.g.
+    {"operation": "repeat",
+     "data": {"times": 1000, "commands": [{"operation": "generate_text", "data": {"user_id": "user_{i}", "text_size": 100}}]}}
+    the commands of an iteration are made only when it is reached (see iter_commands)
+    """
+    __slots__ = ("times", "command_dicts", "var", "start", "_parser")
+
+    @staticmethod
+    def _class_operation():
+        return "repeat"
+
+    @staticmethod
+    def _validate_datas(datas):
+        for data in datas:
+            assert {"times", "commands"} <= data.keys() <= {"times", "commands", "var", "start"}
+            assert type(data["times"]) is int and data["times"] >= 0
+            assert type(data["commands"]) is list
+            assert type(data.get("var", "i")) is str
+            assert type(data.get("start", 0)) is int
+
+    def _parse(self):
+        data = self.cmd["data"]
+        self.times = data["times"]
+        self.command_dicts = data["commands"]
+        self.var = data.get("var", "i")
+        self.start = data.get("start", 0)
+        self._parser = Parser()
+        self._make_commands(self.start) # validates the block once, instead of failing in the middle of the execution
+
+    def _make_commands(self, i):
+        return self._parser.make_commands([_substitute(command_dict, self.var, i) for command_dict in self.command_dicts])
+
+    def iter_commands(self):
+        """
+        :return: generator of the commands of all iterations, nested repeat commands are expanded too
+        """
+        for i in range(self.start, self.start + self.times):
+            yield from expand_commands(self._make_commands(i))
+
+    def execute(self, simulator):
+        for command in self.iter_commands():
+            command.execute(simulator)
+
+def expand_commands(commands):
+    """
+    :param commands: iterable of commands objects
+    :return: generator of the commands, with the repeat commands replaced by the commands of their iterations
+    """
+    for command in commands:
+        if isinstance(command, command_REPEAT):
+            yield from command.iter_commands()
+        else:
+            yield command
+
 class Parser():
     def __init__(self):
         # map operation field to a command object
@@ -179,7 +420,12 @@ class Parser():
                             command_ADD_LOGICAL_OPERATIONS,
                             command_DELETE_LOGICAL_OPERATION,
                             command_DELETE_LOGICAL_OPERATIONS,
-                            command_GENERATE_TEXT_FOR_USER
+                            command_ADD_TRANSITIONS,
+                            command_DELETE_TRANSITIONS,
+                            command_GENERATE_TEXT_FOR_USER,
+                            command_ADD_USERS,
+                            command_GENERATE_POPULATION,
+                            command_REPEAT
                             ]
         self.handlers = {command_obj._class_operation() : command_obj \
                     for command_obj in commands_objects}
@@ -190,22 +436,202 @@ class Parser():
         # pprint.pprint(self.handlers)
 
     def parse(self, command_dict):
-        # print(command_dict)
+        self.commands.append(self.make_command(command_dict))
+
+    def make_command(self, command_dict):
         assert type(command_dict) is dict
         assert "operation" in command_dict.keys()
         assert command_dict["operation"] in self.handlers.keys()
 
         command_obj = self.handlers[command_dict["operation"]]
-        command = command_obj(command_dict)
-        self.commands.append(command)
+        return command_obj(command_dict)
+
+    def make_commands(self, command_dicts):
+        """
+        make_command for a list of command dictionaries: they are validated once per command class,
+        over all the dictionaries of the class, and then made into commands without validating each one
+        :return: list of Command objects
+        """
+        assert all(type(command_dict) is dict and command_dict.get("operation") in self.handlers
+                   for command_dict in command_dicts), "unknown command operation"
+        by_operation = dict()
+        for command_dict in command_dicts:
+            by_operation.setdefault(command_dict["operation"], list()).append(command_dict)
+        for operation, operation_dicts in by_operation.items():
+            self.handlers[operation].validate(operation_dicts)
+        return [self.handlers[command_dict["operation"]](command_dict, validate=False) for command_dict in command_dicts]
 
     def read_file(self, filepath):
         print("reading commands from file: ", filepath)
-        content_str = open(filepath).read()
-        content_str = content_str.replace("\n","")
-        content = eval(content_str)
-        for command_dict in content:
-            self.parse(command_dict)
+        with Instrumentation.stage("parse"):
+            for command in self.iter_file(filepath):
+                self.commands.append(command)
+
+    def iter_file(self, filepath, batch_size=1000):
+        """
+        parses the scenario file one command at a time, without eval and without holding the whole file.
+        two formats are supported:
+            *.jsonl - one json object {"operation": ..., "data": ...} per line (see write_jsonl)
+            other   - a python list literal of command dictionaries, as in scenarios/
+        the commands are validated in batches of #batch_size (see make_commands)
+        :return: generator of Command objects. unlike parse, the commands are not kept in self.commands
+        """
+        if filepath.endswith(".jsonl"):
+            command_dicts = iter_jsonl(filepath)
+        else:
+            command_dicts = iter_literal(filepath)
+        while True:
+            batch = list(itertools.islice(command_dicts, batch_size))
+            if not batch:
+                return
+            yield from self.make_commands(batch)
 
     def get_commands(self):
-        return self.commands
\ No newline at end of file
+        return self.commands
+
+def iter_literal(filepath, buffer_size=1 << 20):
+    """
+    streams the command dictionaries of a scenario written as a python list literal.
+    the file is scanned for the top level elements of the list (tracking brackets, strings and comments),
+    and every element is parsed on its own with ast.literal_eval, so only literals are accepted.
+    """
+    depth = 0
+    quote = None # the quote character while inside a string
+    escaped = False
+    comment = False
+    element = list() # pieces of the current top level element
+
+    with open(filepath) as f:
+        while True:
+            buffer = f.read(buffer_size)
+            if not buffer:
+                break
+            begin = 0 # start of the piece of buffer not yet added to element
+            for match in _special_characters.finditer(buffer):
+                char, i = match.group(), match.start()
+                if comment:
+                    if char == "\n":
+                        comment = False
+                        begin = i
+                    continue
+                if quote is not None:
+                    if escaped:
+                        escaped = False
+                    elif char == "\\":
+                        escaped = True
+                    elif char == quote:
+                        quote = None
+                    continue
+                if char in "'\"":
+                    quote = char
+                elif char == "#":
+                    comment = True
+                    element.append(buffer[begin:i])
+                elif char in "([{":
+                    depth += 1
+                    if depth == 1:
+                        assert char == "[", "a scenario is a list of commands"
+                        begin = i + 1
+                elif char in ")]}":
+                    depth -= 1
+                    if depth == 0:
+                        element.append(buffer[begin:i])
+                        yield from _literal_element(element)
+                        element = list()
+                        begin = i + 1
+                elif char == "," and depth == 1:
+                    element.append(buffer[begin:i])
+                    yield from _literal_element(element)
+                    element = list()
+                    begin = i + 1
+            if not comment and depth >= 1:
+                element.append(buffer[begin:])
+
+    assert depth == 0 and quote is None, "unexpected end of scenario file {}".format(filepath)
+
+_special_characters = re.compile(r"[()\[\]{},'\"\\#\n]")
+
+def _literal_element(element):
+    text = "".join(element).strip()
+    if text: # a trailing comma leaves an empty element
+        yield _parse_literal(text)
+
+# "(" cannot be in the strings of the fast path, so a json list beginning with it was a tuple
+_tuple_marker = "("
+
+def _parse_literal(text):
+    """
+    ast.literal_eval, with a fast path: when the literal has only single quoted strings without escapes,
+    quotes or parentheses inside them, swapping quotes and turning every tuple into a json list headed by
+    _tuple_marker makes it json, which json.loads parses much faster. lists and tuples stay distinct.
+    anything json does not accept (trailing commas, e.g. of 1-tuples, non string keys, NaN, ...) falls back.
+    """
+    if '"' not in text and "\\" not in text:
+        strings = "".join(text.split("'")[1::2])
+        if "(" not in strings and ")" not in strings:
+            try:
+                json_text = text.replace("'", '"').replace("(", '["{}",'.format(_tuple_marker)).replace(")", "]")
+                return _tuples(json.loads(json_text, parse_constant=_not_literal))
+            except ValueError:
+                pass
+    return ast.literal_eval(text)
+
+def _not_literal(name):
+    """
+    json.loads accepts NaN, Infinity and -Infinity, which are not python literals
+    """
+    raise ValueError("{} is not a literal".format(name))
+
+_scalar_types = {str, int, float, bool, type(None)}
+
+def _tuples(value):
+    """
+    :return: value parsed by the fast path of _parse_literal, with its marked lists turned back into tuples
+    """
+    if type(value) is list:
+        nested = not _scalar_types.issuperset(map(type, value))
+        if value and value[0] == _tuple_marker:
+            if len(value) == 2: # (x) is x: a 1-tuple (x,) has a trailing comma, which json rejected
+                return _tuples(value[1])
+            return tuple(_tuples(item) for item in value[1:]) if nested else tuple(value[1:])
+        return [_tuples(item) for item in value] if nested else value
+    if type(value) is dict:
+        return {key : _tuples(item) for key, item in value.items()}
+    return value
+
+def iter_jsonl(filepath):
+    """
+    streams the command dictionaries of a json lines scenario.
+    json has no tuples, so the logical operations and transitions lists are converted back to tuples
+    """
+    with open(filepath) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield _from_json(json.loads(line))
+
+def _from_json(command_dict):
+    data = command_dict.get("data")
+    if type(data) is dict:
+        if "commands" in data: # the block of a repeat command
+            data["commands"] = [_from_json(c) for c in data["commands"]]
+        if "logical_operation" in data:
+            data["logical_operation"] = tuple(data["logical_operation"])
+        if "logical_operations" in data:
+            data["logical_operations"] = [tuple(lo) for lo in data["logical_operations"]]
+        if "transitions" in data:
+            data["transitions"] = [(tuple(transition[0]), tuple(transition[1])) + tuple(transition[2:])
+                                   for transition in data["transitions"]]
+    return command_dict
+
+def write_jsonl(command_dicts, filepath):
+    """
+    writes command dictionaries as a json lines scenario, one command per line (read with Parser.iter_file)
+    """
+    with open(filepath, "w") as f:
+        for command_dict in command_dicts:
+            f.write(json.dumps(command_dict))
+            f.write("\n")
+
+def convert_to_jsonl(filepath_in, filepath_out):
+    write_jsonl(iter_literal(filepath_in), filepath_out)
@@ -0,0 +1,143 @@
+import Executer
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+import traceback
+
+class ScenarioResult():
+    """
+    The outcome of running one scenario file: status is "ok" or "failed" (then error holds the traceback)
+    """
+    def __init__(self, scenario_name, dirout, seed, status, seconds, error=None):
+        self.scenario_name = scenario_name
+        self.dirout = dirout
+        self.seed = seed
+        self.status = status
+        self.seconds = seconds
+        self.error = error
+
+    def __repr__(self):
+        return "<{} {} {}s>".format(self.scenario_name, self.status, round(self.seconds, 3))
+
+def _run_scenario(scenario_name, filepath_in, dirout, seed, output_format="csv", cache_dir=None, checkpoint_dir=None,
+                  pipelined=False):
+    """
+    runs one scenario, never raises: a failure is reported in the returned ScenarioResult
+    """
+    b = time.time()
+    try:
+        Executer.Executer.execute(filepath_in=filepath_in, dirout=dirout, seed=seed, output_format=output_format,
+                                  cache_dir=cache_dir, checkpoint_dir=checkpoint_dir, pipelined=pipelined)
+        status, error = "ok", None
+    except Exception:
+        status, error = "failed", traceback.format_exc()
+    return ScenarioResult(scenario_name=scenario_name, dirout=dirout, seed=seed,
+                          status=status, seconds=time.time() - b, error=error)
+
+class Runner():
+    """
+    Runs many scenario files, each one in its own process, with a process pool of #workers processes.
+    Every scenario gets a fixed seed (seeds[scenario_name], default seed), so its output does not depend
+    on the number of workers or on the order in which scenarios finish.
+    """
+    def __init__(self, dirin_scenarios, root_dirout, workers=None, seed=0, seeds=None, output_format="csv", cache_dir=None,
+                 checkpoint_dir=None, pipelined=False):
+        """
+        :param cache_dir: directory of a Cache.ResultCache shared by the scenarios, None to always simulate
+        :param checkpoint_dir: directory of a Cache.CheckpointStore shared by the scenarios, None for no checkpoints
+        :param pipelined: write the outputs of every scenario with background threads (see Executer.DataWriter)
+        """
+        self.dirin_scenarios = dirin_scenarios
+        self.root_dirout = root_dirout
+        self.workers = os.cpu_count() if workers is None else workers
+        self.seed = seed
+        self.seeds = dict() if seeds is None else dict(seeds)
+        self.output_format = output_format
+        self.cache_dir = cache_dir
+        self.checkpoint_dir = checkpoint_dir
+        self.pipelined = pipelined
+        assert self.workers >= 1
+
+    def get_dirout(self, scenario_name):
+        return os.path.join(self.root_dirout, "case_{}".format(scenario_name))
+
+    def get_seed(self, scenario_name):
+        return self.seeds.get(scenario_name, self.seed)
+
+    def _arguments(self, scenario_name):
+        return (scenario_name,
+                os.path.join(self.dirin_scenarios, scenario_name),
+                self.get_dirout(scenario_name),
+                self.get_seed(scenario_name),
+                self.output_format,
+                self.cache_dir,
+                self.checkpoint_dir,
+                self.pipelined)
+
+    def run(self, scenario_names):
+        """
+        :param scenario_names: names of files under dirin_scenarios
+        :return: list of ScenarioResult, in the order of scenario_names
+        """
+        if self.workers == 1 or len(scenario_names) <= 1:
+            results = [_run_scenario(*self._arguments(name)) for name in scenario_names]
+            for result in results:
+                self._report(result)
+            return results
+
+        results = dict()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(_run_scenario, *self._arguments(name)) : name for name in scenario_names}
+            for future in concurrent.futures.as_completed(futures):
+                name = futures[future]
+                try:
+                    result = future.result()
+                except Exception: # the worker process itself died
+                    result = ScenarioResult(scenario_name=name, dirout=self.get_dirout(name), seed=self.get_seed(name),
+                                            status="failed", seconds=0, error=traceback.format_exc())
+                self._report(result)
+                results[name] = result
+        return [results[name] for name in scenario_names]
+
+    @staticmethod
+    def _report(result):
+        print("[{}] {} in {}s (seed {}) -> {}".format(result.scenario_name, result.status,
+                                                    round(result.seconds, 3), result.seed, result.dirout))
+        if result.error is not None:
+            print(result.error)
+
+def run_scenarios(scenario_names, dirin_scenarios="scenarios", root_dirout="out", workers=None, seed=0, seeds=None,
+                  output_format="csv", cache_dir=None, checkpoint_dir=None, pipelined=False):
+    runner = Runner(dirin_scenarios=dirin_scenarios, root_dirout=root_dirout, workers=workers, seed=seed, seeds=seeds,
+                    output_format=output_format, cache_dir=cache_dir, checkpoint_dir=checkpoint_dir, pipelined=pipelined)
+    return runner.run(scenario_names)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="run scenario files in parallel")
+    parser.add_argument("scenarios", nargs="*", help="scenario names, default: all files under --dirin")
+    parser.add_argument("--dirin", default="scenarios")
+    parser.add_argument("--dirout", default="out")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, default: number of cpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--exclude", nargs="*", default=[])
+    parser.add_argument("--output-format", default="csv", choices=["csv", "parquet", "feather", "npy"])
+    parser.add_argument("--cache-dir", default=None, help="reuse the outputs of unchanged scenarios from this directory")
+    parser.add_argument("--checkpoint-dir", default=None, help="resume scenarios after their longest already executed prefix")
+    parser.add_argument("--pipelined", action="store_true", help="overlap the generation with the writing of the outputs")
+    args = parser.parse_args(argv)
+
+    scenarios = args.scenarios or sorted(os.listdir(args.dirin))
+    scenarios = [s for s in scenarios if s not in args.exclude]
+
+    b = time.time()
+    results = run_scenarios(scenarios, dirin_scenarios=args.dirin, root_dirout=args.dirout,
+                            workers=args.workers, seed=args.seed, output_format=args.output_format,
+                            cache_dir=args.cache_dir, checkpoint_dir=args.checkpoint_dir, pipelined=args.pipelined)
+    failed = [r for r in results if r.status != "ok"]
+    print("{} scenarios, {} failed, {}s".format(len(results), len(failed), round(time.time() - b, 3)))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
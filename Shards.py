@@ -0,0 +1,186 @@
+"""
+Sharded simulation: the users of a scenario are split into #shards shards by a hash of their ids,
+every shard simulates only its users (in its own process, possibly on another node sharing the file system),
+and a merge writes the same outputs as a single run with per_user_streams (see Executer.execute).
+
+    python Shards.py shard scenarios/s1 shards_dir --shard 0 --shards 4     (one per shard, anywhere)
+    python Shards.py merge scenarios/s1 shards_dir out/case_s1 --shards 4   (after all shards are done)
+    python Shards.py run scenarios/s1 out/case_s1 --shards 4                (all of it, with local processes)
+
+Every shard writes to shards_dir/shard_<k>/:
+    entries.pkl  a stream of pickled records, one per text: the global position of the text (the index of its
+                 command, of the step of the command, e.g. the user of a population, and of the text in the step),
+                 user, session and the text arrays
+    symbols.pkl  the shard's letters and logical operations, the vocabulary the ids of the records refer to
+    hist.pkl     the shard's histogram (its users only)
+    done         written last, the merge waits for nothing and fails if a shard is not done
+The merge streams the records of all shards in global order (a heap merge), re-interns their ids into one
+SymbolTable and writes them with a DataWriter, so full_sql_id and text_index are global.
+"""
+
+import Executer
+import Instrumentation
+import Parser
+import Simulator
+import argparse
+import concurrent.futures
+import heapq
+import numpy as np
+import os
+import pickle
+import shutil
+import sys
+import zlib
+
+def user_shard(user_id, shards):
+    return zlib.crc32(str(user_id).encode("utf-8")) % shards
+
+class ShardFilter():
+    """
+    Simulator.user_filter of one shard
+    """
+    def __init__(self, shard, shards):
+        assert 0 <= shard < shards
+        self.shard = shard
+        self.shards = shards
+
+    def __call__(self, user_id):
+        return user_shard(user_id, self.shards) == self.shard
+
+def shard_dir(dirshards, shard):
+    return os.path.join(dirshards, "shard_{}".format(shard))
+
+def run_shard(filepath_in, dirshards, shard, shards, seed=0):
+    """
+    simulates the users of the shard: the commands of other users are skipped, and the bulk commands
+    skip them through the simulator's user_filter. the users draw from their own streams (per_user_streams),
+    so a user's texts do not depend on the shard it is in
+    """
+    dirout = shard_dir(dirshards, shard)
+    os.makedirs(dirout, exist_ok=True)
+    selected = ShardFilter(shard, shards)
+    simulator = Simulator.Simulator(seed=seed, per_user_streams=True, retention=Simulator.RETAIN_NONE)
+    simulator.user_filter = selected
+
+    parser = Parser.Parser()
+    commands = Parser.expand_commands(parser.iter_file(filepath_in))
+    with open(os.path.join(dirout, "entries.pkl"), "wb") as f:
+        for seq, command in enumerate(commands):
+            user_id = getattr(command, "user_id", None)
+            if user_id is not None and not selected(user_id):
+                continue
+            for step, _ in enumerate(command.iter_execute(simulator)):
+                for index, text_entry in enumerate(simulator.iter_text_entries(flush=True)):
+                    record = {"position" : (seq, step, index),
+                              "user_id" : text_entry["user_id"],
+                              "session_id" : text_entry["session_id"],
+                              "text" : np.asarray(text_entry["text"]),
+                              "letters_logical_operations" : np.asarray(text_entry["letters_logical_operations"]),
+                              "lo_index" : np.asarray(text_entry["lo_index"])}
+                    pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    with open(os.path.join(dirout, "symbols.pkl"), "wb") as f:
+        pickle.dump({"letters" : simulator.symbols.letters,
+                     "logical_operations" : simulator.symbols.logical_operations}, f)
+    simulator.get_histogram().to_pickle(os.path.join(dirout, "hist.pkl"))
+    open(os.path.join(dirout, "done"), "w").close()
+
+def _iter_records(filepath):
+    with open(filepath, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+def _shard_records(dirout, symbols):
+    """
+    :return: generator of (position, record) of the shard, with the ids of the record re-interned into symbols
+    """
+    with open(os.path.join(dirout, "symbols.pkl"), "rb") as f:
+        shard_symbols = pickle.load(f)
+    letters = np.array([symbols.letter_id(letter) for letter in shard_symbols["letters"]], dtype=np.int32)
+    logical_operations = np.array([symbols.logical_operation_id(lo) for lo in shard_symbols["logical_operations"]],
+                                  dtype=np.int32)
+    for record in _iter_records(os.path.join(dirout, "entries.pkl")):
+        record["text"] = letters[record["text"]]
+        record["letters_logical_operations"] = logical_operations[record["letters_logical_operations"]]
+        yield record["position"], record
+
+def merge(filepath_in, dirshards, dirout, shards, output_format="csv"):
+    """
+    writes the outputs of the shards as one output directory, the same as a single run
+    """
+    dirouts = [shard_dir(dirshards, shard) for shard in range(shards)]
+    for shard, dirshard in enumerate(dirouts):
+        assert os.path.exists(os.path.join(dirshard, "done")), "shard {} is not done".format(shard)
+
+    os.makedirs(dirout, exist_ok=True)
+    shutil.copy(filepath_in, os.path.join(dirout, "simulation.txt"))
+    symbols = Simulator.SymbolTable()
+    writer = Executer.DataWriter(dirout=dirout, symbols=symbols, output_format=output_format)
+    with Instrumentation.stage("merge"):
+        for _, record in heapq.merge(*[_shard_records(dirshard, symbols) for dirshard in dirouts],
+                                     key=lambda item : item[0]):
+            record["size"] = len(record["text"])
+            writer.write_entry(record)
+
+    # the users of the shards are disjoint, so their rows are the rows of a single run's histogram
+    import pandas as pd
+    histogram = pd.concat([pd.read_pickle(os.path.join(dirshard, "hist.pkl")) for dirshard in dirouts])
+    histogram.sort_values(by=["user_id", "logical_operation"], inplace=True)
+    writer.close(histogram=histogram)
+
+def run_local(filepath_in, dirout, shards, seed=0, workers=None, output_format="csv", dirshards=None):
+    """
+    runs the shards in a process pool, then merges them
+    :param dirshards: directory of the shards parts, default: dirout/shards (removed after the merge)
+    """
+    remove = dirshards is None
+    dirshards = os.path.join(dirout, "shards") if dirshards is None else dirshards
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers or shards) as pool:
+        futures = [pool.submit(run_shard, filepath_in, dirshards, shard, shards, seed) for shard in range(shards)]
+        for future in futures:
+            future.result()
+    merge(filepath_in, dirshards, dirout, shards, output_format=output_format)
+    if remove:
+        shutil.rmtree(dirshards, ignore_errors=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="sharded simulation of a scenario")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    shard_parser = subparsers.add_parser("shard", help="simulate the users of one shard")
+    shard_parser.add_argument("scenario")
+    shard_parser.add_argument("dirshards")
+    shard_parser.add_argument("--shard", type=int, required=True)
+
+    merge_parser = subparsers.add_parser("merge", help="merge the parts of all shards")
+    merge_parser.add_argument("scenario")
+    merge_parser.add_argument("dirshards")
+    merge_parser.add_argument("dirout")
+
+    run_parser = subparsers.add_parser("run", help="run all shards with local processes, then merge")
+    run_parser.add_argument("scenario")
+    run_parser.add_argument("dirout")
+    run_parser.add_argument("--workers", type=int, default=None)
+
+    for subparser in [shard_parser, merge_parser, run_parser]:
+        subparser.add_argument("--shards", type=int, required=True)
+    for subparser in [shard_parser, run_parser]:
+        subparser.add_argument("--seed", type=int, default=0)
+    for subparser in [merge_parser, run_parser]:
+        subparser.add_argument("--output-format", default="csv", choices=["csv", "parquet", "feather", "npy"])
+    args = parser.parse_args(argv)
+
+    if args.command == "shard":
+        run_shard(args.scenario, args.dirshards, args.shard, args.shards, seed=args.seed)
+    elif args.command == "merge":
+        merge(args.scenario, args.dirshards, args.dirout, args.shards, output_format=args.output_format)
+    else:
+        run_local(args.scenario, args.dirout, args.shards, seed=args.seed, workers=args.workers,
+                  output_format=args.output_format)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,354 @@
 import numpy as np
+import bisect
+import hashlib
 import itertools
-import pandas as pd
 import time
+import Instrumentation
+import Table
+import TextStore
+
+class SymbolTable():
+    """
+    Interns letters and logical operations to small integer ids.
+    One table is shared by all users of a simulator, so texts are kept as compact int32 arrays of ids
+    and decoded back to strings only when writing the output.
+    """
+    def __init__(self):
+        self.letters = list()
+        self.letters_ids = dict()
+
+        self.logical_operations = list()
+        self.logical_operations_ids = dict()
+        self.logical_operations_letters = list() # per logical operation, a tuple of its letters ids
+
+        # columnar view of the logical operations (see get_arrays), in arrays grown by doubling as they are interned
+        self._lengths = np.zeros(0, dtype=np.int64)
+        self._offsets = np.zeros(0, dtype=np.int64)
+        self._letters = np.zeros(0, dtype=np.int32)
+        self._letters_size = 0
+        self._decoding = dict() # name of a symbols list to (object array, number of symbols in it), see decoding_array
+
+    def letter_id(self, letter):
+        letter_id = self.letters_ids.get(letter)
+        if letter_id is None:
+            letter_id = len(self.letters)
+            self.letters.append(letter)
+            self.letters_ids[letter] = letter_id
+        return letter_id
+
+    def logical_operation_id(self, logical_operation):
+        """
+        :param logical_operation: tuple of letters
+        :return: the id of the logical operation, interning it (and its letters) if needed
+        """
+        logical_operation_id = self.logical_operations_ids.get(logical_operation)
+        if logical_operation_id is None:
+            logical_operation_id = len(self.logical_operations)
+            self.logical_operations.append(logical_operation)
+            self.logical_operations_ids[logical_operation] = logical_operation_id
+            letters_ids = tuple(self.letter_id(letter) for letter in logical_operation)
+            self.logical_operations_letters.append(letters_ids)
+            self._append_arrays(logical_operation_id, letters_ids)
+        return logical_operation_id
+
+    def _append_arrays(self, logical_operation_id, letters_ids):
+        begin, end = self._letters_size, self._letters_size + len(letters_ids)
+        self._lengths = _grow(self._lengths, logical_operation_id, logical_operation_id + 1)
+        self._offsets = _grow(self._offsets, logical_operation_id, logical_operation_id + 1)
+        self._letters = _grow(self._letters, begin, end)
+        self._lengths[logical_operation_id] = len(letters_ids)
+        self._offsets[logical_operation_id] = begin
+        self._letters[begin:end] = letters_ids
+        self._letters_size = end
+
+    def find_logical_operation_id(self, logical_operation):
+        """
+        :return: the id of the logical operation, or None if it was never interned
+        """
+        return self.logical_operations_ids.get(logical_operation)
+
+    def get_arrays(self):
+        """
+        :return: (lengths, offsets, letters) arrays over all logical operations ids.
+                 the letters of logical operation i are letters[offsets[i] : offsets[i] + lengths[i]].
+                 they are views, which logical operations interned later never change
+        """
+        size = len(self.logical_operations)
+        return self._lengths[:size], self._offsets[:size], self._letters[:self._letters_size]
+
+    def get_letters(self, text_logical_operations):
+        """
+        :param text_logical_operations: int array of logical operations ids
+        :return: (letters, letters_logical_operations, lo_index) arrays, one value per letter of the flat text:
+                 the letter id, the id of the logical operation it belongs to, and its index in that logical operation
+        """
+        lengths, offsets, letters = self.get_arrays()
+        text_logical_operations = np.asarray(text_logical_operations, dtype=np.int32)
+        text_lengths = lengths[text_logical_operations]
+        begin_index = np.cumsum(text_lengths) - text_lengths
+        lo_index = np.arange(int(text_lengths.sum()), dtype=np.int64) - np.repeat(begin_index, text_lengths)
+        text = letters[np.repeat(offsets[text_logical_operations], text_lengths) + lo_index]
+        return text, np.repeat(text_logical_operations, text_lengths), lo_index
+
+    def get_text(self, text_logical_operations):
+        """
+        :param text_logical_operations: int array of logical operations ids
+        :return: int32 array of letters ids, the flat text
+        """
+        return self.get_letters(text_logical_operations)[0]
+
+    def decoding_array(self, name):
+        """
+        :param name: "letters" or "logical_operations"
+        :return: object array of the symbols interned so far, by id. the array grows by doubling as symbols are
+                 added, so decoding costs O(new symbols) and not O(vocabulary). the returned view never changes:
+                 symbols added later are written past its end, or to a new array
+        """
+        items = getattr(self, name)
+        array, size = self._decoding.get(name, (np.empty(0, dtype=object), 0))
+        if size < len(items):
+            array = _grow(array, size, len(items))
+            array[size:len(items)] = _object_array(items[size:])
+            size = len(items)
+            self._decoding[name] = (array, size)
+        return array[:size]
+
+    def decode_letters(self, letters_ids):
+        """
+        :param letters_ids: int array of letters ids
+        :return: object array of the letters (str)
+        """
+        return self.decoding_array("letters")[np.asarray(letters_ids, dtype=np.int64)]
+
+    def decode_logical_operations(self, logical_operations_ids):
+        """
+        :param logical_operations_ids: int array of logical operations ids
+        :return: object array of the logical operations (tuples of letters)
+        """
+        return self.decoding_array("logical_operations")[np.asarray(logical_operations_ids, dtype=np.int64)]
+
+    def get_locations(self, text_logical_operations, letters=None):
+        """
+        columnar version of User.get_locations, over ids.
+        :param text_logical_operations: int array of logical operations ids
+        :param letters: get_letters(text_logical_operations), when it was already computed
+        :return: (df_logical_operations_locations, df_full_logical_operations_locations), see User.get_locations.
+                 the logical_operation and text columns hold ids, use decode_logical_operations and decode_letters
+        """
+        lengths, _, _ = self.get_arrays()
+        text_logical_operations = np.asarray(text_logical_operations, dtype=np.int32)
+        if letters is None:
+            letters = self.get_letters(text_logical_operations)
+        text, letters_logical_operations, lo_index = letters
+
+        text_lengths = lengths[text_logical_operations]
+        end_index = np.cumsum(text_lengths)
+        begin_index = end_index - text_lengths
+        end_index -= 1 # end_index is inclusive
+
+        import pandas as pd # the location frames are built only for the simulators retaining the texts
+        df_logical_operations_locations = pd.DataFrame({"logical_operation" : text_logical_operations,
+                                                        "begin_index" : begin_index,
+                                                        "end_index" : end_index})
+
+        df_full_logical_operations_locations = full_locations_frame(text, letters_logical_operations, lo_index)
+
+        return df_logical_operations_locations, df_full_logical_operations_locations
+
+    def decode_locations(self, locations):
+        """
+        :param locations: a (basic, full) pair returned by get_locations
+        :return: copies of the pair with the logical_operation and text columns decoded
+        """
+        df_basic, df_full = locations[0].copy(), locations[1].copy()
+        df_basic["logical_operation"] = self.decode_logical_operations(df_basic["logical_operation"].values)
+        df_full["logical_operation"] = self.decode_logical_operations(df_full["logical_operation"].values)
+        df_full["text"] = self.decode_letters(df_full["text"].values)
+        return df_basic, df_full
+
+def full_locations_frame(text, letters_logical_operations, lo_index):
+    """
+    :return: df_full_logical_operations_locations (see User.get_locations) of a text given as id arrays
+    """
+    import pandas as pd
+    return pd.DataFrame({"logical_operation" : letters_logical_operations,
+                         "text" : text,
+                         "text_index" : np.arange(len(text), dtype=np.int64),
+                         "lo_index" : np.asarray(lo_index, dtype=np.int64)})
+
+def get_full_locations(text_entry):
+    """
+    :return: the locations_full frame of a text entry, built from its arrays for entries of a TextStore
+    """
+    if "locations_full" in text_entry:
+        return text_entry["locations_full"]
+    return full_locations_frame(text_entry["text"], text_entry["letters_logical_operations"], text_entry["lo_index"])
+
+class StoredLocations():
+    """
+    The (basic, full) locations pair of a text of a TextStore, as User.locations keeps for the texts in RAM.
+    It holds only views of the store: the frames are built from them when the pair is indexed or unpacked
+    """
+    __slots__ = ("symbols", "logical_operations", "letters")
+
+    def __init__(self, symbols, logical_operations, letters):
+        """
+        :param letters: (text, letters_logical_operations, lo_index) views, as returned by SymbolTable.get_letters
+        """
+        self.symbols = symbols
+        self.logical_operations = logical_operations
+        self.letters = letters
+
+    def _pair(self):
+        return self.symbols.get_locations(self.logical_operations, self.letters)
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, index):
+        return self._pair()[index]
+
+    def __iter__(self):
+        return iter(self._pair())
+
+def _grow(array, size, needed):
+    """
+    :param size: the number of values in use at the beginning of array
+    :return: array if it has room for #needed values, else a new array of at least twice its capacity
+             with its first #size values, so appending n values one at a time costs O(n) overall
+    """
+    if needed <= len(array):
+        return array
+    grown = np.empty(max(2 * len(array), needed, 16), dtype=array.dtype)
+    grown[:size] = array[:size]
+    return grown
+
+def _object_array(items):
+    """
+    :param items: list of objects (e.g. tuples) to keep as single array cells
+    :return: 1d numpy array of dtype object, without numpy unpacking the tuples
+    """
+    array = np.empty(len(items), dtype=object)
+    for i, item in enumerate(items):
+        array[i] = item
+    return array
+
+def _random_sample(random_state, size):
+    """
+    :return: #size uniform floats in [0, 1) from either the legacy random state api or a np.random.Generator
+    """
+    if isinstance(random_state, np.random.Generator):
+        return random_state.random(size)
+    return random_state.random_sample(size)
+
+def user_random_state(seed, user_id):
+    """
+    :return: a np.random.Generator for the user, spawned from SeedSequence(seed).
+             the spawn key is a hash of user_id (and not the order of add_user),
+             so the stream of a user is the same whatever other users exist, and in whatever process it runs.
+             the hash is the 256 bits of sha256 over the type and repr of the id, so 1 and "1" get different
+             streams and distinct ids practically never share one
+    """
+    digest = hashlib.sha256("{}:{!r}".format(type(user_id).__name__, user_id).encode("utf-8")).digest()
+    spawn_key = tuple(np.frombuffer(digest, dtype="<u4").tolist())
+    return np.random.Generator(np.random.PCG64(np.random.SeedSequence(seed, spawn_key=spawn_key)))
+
+def _sample_texts(sampler, bit_generator_state, sizes):
+    """
+    samples the texts of one user in a worker process, see Simulator.generate_texts_for_users
+    :return: (list of int32 arrays of logical operations ids, the bit generator state after sampling)
+    """
+    random_state = np.random.Generator(np.random.PCG64())
+    random_state.bit_generator.state = bit_generator_state
+    texts_logical_operations = [sampler.sample(size, random_state) for size in sizes]
+    return texts_logical_operations, random_state.bit_generator.state
+
+# retention policies of Simulator and User: what is kept of the generated texts
+RETAIN_ALL = "all"       # users keep every text, the simulator keeps every text entry until it is cleared
+RETAIN_COUNTS = "counts" # users keep only histogram counts, the simulator keeps text entries until they are flushed
+RETAIN_NONE = "none"     # users keep only histogram counts, text entries are dropped once iter_text_entries yields them
+RETENTIONS = [RETAIN_ALL, RETAIN_COUNTS, RETAIN_NONE]
+
+class Sampler():
+    """
+    Draws logical operations ids with probabilities lineary proportional to their scores.
+    The cumulative table is built once, then every draw is a binary search over it.
+    The draws are the same as np.random.choice(..., p=probabilities) for the same random state.
+    """
+    def __init__(self, logical_operations, probabilities):
+        """
+        :param logical_operations: int array of logical operations ids
+        :param probabilities: probabilities, one per logical operation (see User.get_probabilities)
+        """
+        assert len(logical_operations) == len(probabilities) > 0
+        self.logical_operations = np.asarray(logical_operations, dtype=np.int32)
+        self.cdf = np.asarray(probabilities, dtype=np.float64).cumsum()
+        self.cdf /= self.cdf[-1]
+
+    def sample(self, size, random_state=np.random):
+        """
+        :param size: number of draws
+        :param random_state: np.random (the global random state), a np.random.RandomState or a np.random.Generator
+        :return: int32 array of logical operations ids
+        """
+        uniform_samples = _random_sample(random_state, size)
+        return self.logical_operations[self.cdf.searchsorted(uniform_samples, side="right")]
+
+class MarkovSampler():
+    """
+    Draws a sequence of logical operations ids as a Markov chain: the first one with the scores probabilities,
+    then every next one with the transitions scores from the previous one. A logical operation without transitions
+    (to logical operations of the vocabulary) is followed by a draw with the scores probabilities, as in Sampler.
+    The per row cumulative tables are built once, and the uniform draws and the fallback draws are made in one batch,
+    so only the binary searches in the transitions rows are made step by step.
+    """
+    def __init__(self, logical_operations, probabilities, transitions):
+        """
+        :param logical_operations: int array of logical operations ids
+        :param probabilities: probabilities, one per logical operation (see User.get_probabilities)
+        :param transitions: dict of (from logical operation id, to logical operation id) to score
+        """
+        self.base = Sampler(logical_operations, probabilities)
+        self.logical_operations = self.base.logical_operations
+        index = {logical_operation_id : i for i, logical_operation_id in enumerate(self.logical_operations.tolist())}
+
+        rows = dict() # index of the from logical operation to (indices of the to logical operations, scores)
+        for (from_id, to_id), score in transitions.items():
+            if from_id in index and to_id in index and score > 0:
+                targets, scores = rows.setdefault(index[from_id], (list(), list()))
+                targets.append(index[to_id])
+                scores.append(score)
+
+        self.rows = [None] * len(self.logical_operations) # (cdf list, targets list) per from index, None without transitions
+        for i, (targets, scores) in rows.items():
+            cdf = np.asarray(scores, dtype=np.float64).cumsum()
+            cdf /= cdf[-1]
+            self.rows[i] = (cdf.tolist(), targets)
+        self.has_transitions = len(rows) > 0
+
+    def sample(self, size, random_state=np.random):
+        """
+        :param size: number of draws
+        :param random_state: np.random (the global random state), a np.random.RandomState or a np.random.Generator
+        :return: int32 array of logical operations ids
+        """
+        uniform_samples = _random_sample(random_state, size)
+        states = self.base.cdf.searchsorted(uniform_samples, side="right") # the draws without transitions
+        if not self.has_transitions or size <= 1:
+            return self.logical_operations[states]
+
+        uniform_samples = uniform_samples.tolist()
+        states = states.tolist()
+        rows = self.rows
+        state = states[0]
+        for i in range(1, size):
+            row = rows[state]
+            if row is None:
+                state = states[i]
+            else:
+                cdf, targets = row
+                state = states[i] = targets[bisect.bisect_right(cdf, uniform_samples[i])]
+        return self.logical_operations[np.asarray(states, dtype=np.intp)]
 
 #TODO UserVocabulary
 class User():
@@ -9,17 +356,90 @@ class User():
     Containse the list of logical operations for the user, associated with their frequency scores.
     Can generate a text based on this data
     """
-    def __init__(self, user_id):
+    __slots__ = ("user_id", "session_id", "symbols", "random_state", "store", "retention",
+                 "_ids", "_scores", "_size", "_positions", "_deleted", "transitions", "_sampler",
+                 "sessions", "texts", "texts_logical_operations", "locations", "counts", "histogram_order", "histogram_rows")
+
+    def __init__(self, user_id, symbols=None, random_state=None, store=None, retention=None):
+        """
+        :param store: optional TextStore.TextStore, where the generated texts are kept instead of RAM
+        :param retention: RETAIN_ALL (default) keeps every text in the lists below,
+                          RETAIN_COUNTS and RETAIN_NONE keep only the histogram counts
+        """
         self.user_id = user_id
         self.session_id = None
-
-        self.logical_operations_scores = dict()
-
+        self.symbols = SymbolTable() if symbols is None else symbols
+        self.random_state = np.random if random_state is None else random_state # see Sampler.sample
+        self.store = store
+        self.retention = RETAIN_ALL if retention is None else retention
+        assert self.retention in RETENTIONS
+
+        # the vocabulary, as parallel arrays in the order the logical operations were added (see vocabulary_ids).
+        # the first #_size values are in use, the arrays grow by doubling (see _grow), and a deleted logical
+        # operation leaves an id of -1 until the arrays are compacted, so adding and deleting one costs O(1)
+        self._ids = np.zeros(0, dtype=np.int32) # logical operations ids
+        self._scores = np.zeros(0, dtype=np.float64)
+        self._size = 0
+        self._positions = dict() # logical operation id to its position in the arrays
+        self._deleted = 0 # number of deleted positions
+        self.transitions = dict() # (from logical operation id, to logical operation id) to score
+        self._sampler = None # cached Sampler, reset whenever the vocabulary or the transitions change
+
+        # the generated texts, kept only with RETAIN_ALL
         self.sessions = list()
-        self.texts = list()
-        self.texts_logical_operations = list()
+        self.texts = list() # int32 arrays of letters ids
+        self.texts_logical_operations = list() # int32 arrays of logical operations ids
         self.locations = list()
 
+        # histogram, maintained at generation time (see _count)
+        # one row per logical operation the user generated: it costs O(own vocabulary), however many symbols exist
+        self.counts = np.zeros(0, dtype=np.int64) # occurrences, by row (grown by doubling, see _grow)
+        self.histogram_order = list() # the logical operations ids of the rows, by first occurrence
+        self.histogram_rows = dict() # logical operation id to its row
+
+    def __getstate__(self):
+        state = {name : getattr(self, name) for name in self.__slots__}
+        if state["random_state"] is np.random:
+            state["random_state"] = None # the global random state is pickled by the Simulator
+        state["store"] = None # attached again by Simulator.set_store
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        if self.random_state is None:
+            self.random_state = np.random
+
+    def _compact(self):
+        if self._deleted:
+            keep = self._ids[:self._size] >= 0
+            self._ids, self._scores = self._ids[:self._size][keep], self._scores[:self._size][keep]
+            self._size, self._deleted = len(self._ids), 0
+            self._positions = dict(zip(self._ids.tolist(), range(self._size)))
+
+    @property
+    def vocabulary_ids(self):
+        """
+        :return: int32 array of the logical operations ids of the vocabulary, in the order they were added
+        """
+        self._compact()
+        return self._ids[:self._size]
+
+    @property
+    def vocabulary_scores(self):
+        """
+        :return: float64 array of the scores of vocabulary_ids
+        """
+        self._compact()
+        return self._scores[:self._size]
+
+    @property
+    def logical_operations_scores(self):
+        """
+        :return: dict of logical operation id to score, in the vocabulary order (a copy, changing it changes nothing)
+        """
+        return dict(zip(self.vocabulary_ids.tolist(), self.vocabulary_scores.tolist()))
+
     def add_logical_operation(self, logical_operation, score):
         """
         :param logical_operation: tuple of letters
@@ -28,56 +448,224 @@ class User():
         assert type(logical_operation) is tuple
         assert all([type(letter) is str for letter in logical_operation])
         assert type(score) in [int, float]
-        self.logical_operations_scores[logical_operation] = score
+        logical_operation_id = self.symbols.logical_operation_id(logical_operation)
+        position = self._positions.get(logical_operation_id)
+        if position is None:
+            position = self._positions[logical_operation_id] = self._size
+            self._ids = _grow(self._ids, self._size, self._size + 1)
+            self._scores = _grow(self._scores, self._size, self._size + 1)
+            self._ids[position] = logical_operation_id
+            self._size += 1
+        self._scores[position] = score
+        self._sampler = None
+
+    def add_logical_operations(self, logical_operations, scores):
+        """
+        add_logical_operation for many logical operations at once
+        :param logical_operations: list of tuples of letters
+        :param scores: list (or array) of float numbers, one per logical operation
+        """
+        assert len(logical_operations) == len(scores)
+        self._set_scores([self.symbols.logical_operation_id(lo) for lo in logical_operations], scores)
+
+    def _set_scores(self, logical_operations_ids, scores):
+        """
+        the same as assigning the scores one by one in a dict of logical operation id to score:
+        a logical operation of the vocabulary keeps its position, a new one is appended at its first occurrence,
+        and a logical operation repeated in logical_operations_ids gets its last score
+        """
+        ids = np.asarray(logical_operations_ids, dtype=np.int32)
+        scores = np.asarray(scores, dtype=np.float64)
+        if len(ids) > 1:
+            unique, first = np.unique(ids, return_index=True)
+            last = len(ids) - 1 - np.unique(ids[::-1], return_index=True)[1]
+            by_first = np.argsort(first)
+            ids, scores = unique[by_first], scores[last][by_first]
+
+        positions = np.array([self._positions.get(i, -1) for i in ids.tolist()], dtype=np.int64)
+        known = positions >= 0
+        self._scores[positions[known]] = scores[known]
+        if not known.all():
+            new_ids, begin = ids[~known], self._size
+            end = begin + len(new_ids)
+            self._ids = _grow(self._ids, begin, end)
+            self._scores = _grow(self._scores, begin, end)
+            self._ids[begin:end] = new_ids
+            self._scores[begin:end] = scores[~known]
+            self._positions.update(zip(new_ids.tolist(), range(begin, end)))
+            self._size = end
+        self._sampler = None
 
     def del_logical_operation(self, logical_operation):
-        if logical_operation not in self.logical_operations_scores:
+        position = self._positions.pop(self.symbols.find_logical_operation_id(logical_operation), None)
+        if position is None:
             return # maybe throw an exception
-        del self.logical_operations_scores[logical_operation]
+        self._ids[position] = -1 # removed by _compact, when the vocabulary arrays are read
+        self._deleted += 1
+        self._sampler = None
+
+    def add_transition(self, from_logical_operation, to_logical_operation, score):
+        """
+        makes the user's texts a Markov chain: after from_logical_operation, the next logical operation is drawn
+        with probabilities lineary proportional to the scores of the transitions from it (see MarkovSampler)
+        :param from_logical_operation: tuple of letters
+        :param to_logical_operation: tuple of letters
+        :param score: float number, frequency score for this transition
+        """
+        assert type(from_logical_operation) is tuple and type(to_logical_operation) is tuple
+        assert type(score) in [int, float]
+        key = (self.symbols.logical_operation_id(from_logical_operation),
+               self.symbols.logical_operation_id(to_logical_operation))
+        self.transitions[key] = score
+        self._sampler = None
+
+    def del_transition(self, from_logical_operation, to_logical_operation):
+        key = (self.symbols.find_logical_operation_id(from_logical_operation),
+               self.symbols.find_logical_operation_id(to_logical_operation))
+        if key not in self.transitions:
+            return
+        del self.transitions[key]
+        self._sampler = None
+
+    def get_logical_operations(self):
+        """
+        :return: the user's logical operations (tuples of letters), in the vocabulary order
+        """
+        return [self.symbols.logical_operations[i] for i in self.vocabulary_ids.tolist()]
 
     def set_session(self, session_id):
         self.session_id = session_id
 
     def get_probabilities(self):
         """
-        :return: a list of frequency probabilities, lineary proportional to the scores
+        :return: array of frequency probabilities, lineary proportional to the scores
         """
-        scores = self.logical_operations_scores.values()
-        total_scores= sum(scores)
-        probs = [score/total_scores for score in scores]
-        assert np.isclose(sum(probs), 1)
+        assert len(self.vocabulary_scores) > 0, "user {} has no logical operations".format(self.user_id)
+        total_scores = self.vocabulary_scores.cumsum()[-1] # summed in order, as the builtin sum
+        probs = self.vocabulary_scores / total_scores
+        assert np.isclose(probs.sum(), 1)
         return probs
 
+    def get_sampler(self):
+        """
+        :return: a Sampler over the user's logical operations (a MarkovSampler if the user has transitions),
+                 built only after the vocabulary or the transitions changed
+        """
+        if self._sampler is None:
+            if self.transitions:
+                self._sampler = MarkovSampler(self.vocabulary_ids.copy(), self.get_probabilities(), self.transitions)
+            else:
+                self._sampler = Sampler(self.vocabulary_ids.copy(), self.get_probabilities())
+        return self._sampler
+
     def generate_text(self, text_size_logical_operations):
         """
         :param text_size_logical_operations: number of logical operations occurrences in the new text
-        :return: a flat sequence of letters, with #text_size occurrences of user's logical operations
+        :return: a text entry. its text is a flat int32 array of letters ids (see SymbolTable),
+                 with #text_size occurrences of user's logical operations
+        """
+        return self.add_text(self.sample_text(text_size_logical_operations))
+
+    def sample_text(self, text_size_logical_operations):
+        """
+        :return: int32 array of #text_size logical operations ids, drawn from the user's random state
         """
         assert self.session_id is not None
-        logical_operations = list(self.logical_operations_scores.keys())
-        probs = self.get_probabilities()
+        with Instrumentation.stage("sample", logical_operations=text_size_logical_operations):
+            return self.get_sampler().sample(text_size_logical_operations, self.random_state)
 
-        num_logical_operations = len(logical_operations)
-        text_logical_operations_indices = np.random.choice(a=range(num_logical_operations),
-                                                           size=text_size_logical_operations,
-                                                           replace=True,
-                                                           p = probs)
-        text_logical_operations = [logical_operations[i] for i in text_logical_operations_indices]
-        text = list(itertools.chain.from_iterable(text_logical_operations))
+    def add_text(self, text_logical_operations):
+        """
+        :param text_logical_operations: int32 array of logical operations ids, as returned by sample_text
+        :return: the text entry of the new text, in the user's current session
+        """
+        assert self.session_id is not None
+        with Instrumentation.stage("text") as record:
+            letters = self.symbols.get_letters(text_logical_operations)
+            record["tokens"] = len(letters[0])
+        with Instrumentation.stage("histogram"):
+            self._count(text_logical_operations)
+
+        if self.store is not None:
+            return self._add_stored_text(text_logical_operations, letters)
+        text, letters_logical_operations, lo_index = letters
+        if self.retention != RETAIN_ALL:
+            # nobody keeps the location frames: they are built only when asked for (see get_full_locations)
+            return self._text_entry(text, text_logical_operations, letters_logical_operations, lo_index)
+
+        with Instrumentation.stage("locations", tokens=len(text)):
+            locations = self.symbols.get_locations(text_logical_operations, letters)
+        self._retain(text, text_logical_operations, locations)
+
+        text_entry = self._text_entry(text, text_logical_operations,
+                                      locations[1]["logical_operation"].values, locations[1]["lo_index"].values)
+        text_entry["locations_basic"] = locations[0]
+        text_entry["locations_full"] = locations[1]
+        return text_entry
 
+    def _text_entry(self, text, text_logical_operations, letters_logical_operations, lo_index):
+        return {"user_id" : self.user_id,
+                "session_id" : self.session_id,
+                "text" : text,
+                "logical_operations" : text_logical_operations,
+                "letters_logical_operations" : letters_logical_operations,
+                "lo_index" : lo_index,
+                "size" : len(text)
+                }
+
+    def _retain(self, text, text_logical_operations, locations):
+        """
+        keeps the text in the user's lists, unless the retention policy keeps only the histogram counts
+        """
+        if self.retention != RETAIN_ALL:
+            return
         self.texts.append(text)
         self.texts_logical_operations.append(text_logical_operations)
         self.sessions.append(self.session_id)
-        self.locations.append(self.get_locations(text_logical_operations))
-
-        text_entry = {"user_id" : self.user_id,
-                      "session_id" : self.session_id,
-                      "text" : self.texts[-1],
-                      "size" : len(self.texts[-1]),
-                      "locations_basic" : self.locations[-1][0],
-                      "locations_full" : self.locations[-1][1]
-                      }
-        return text_entry
+        self.locations.append(locations)
+
+    def _add_stored_text(self, text_logical_operations, letters):
+        """
+        appends the text and its locations to the TextStore. the text entry and the user keep views of the files,
+        the location frames are built only when asked for (see get_full_locations and StoredLocations)
+        """
+        text, letters_logical_operations, lo_index = letters
+        with Instrumentation.stage("store", tokens=len(text)):
+            views = self.store.append(letters=text,
+                                      letters_logical_operations=letters_logical_operations,
+                                      lo_index=lo_index,
+                                      logical_operations=text_logical_operations)
+        self._retain(views["letters"], views["logical_operations"],
+                     StoredLocations(self.symbols, views["logical_operations"],
+                                     (views["letters"], views["letters_logical_operations"], views["lo_index"])))
+        return self._text_entry(views["letters"], views["logical_operations"], views["letters_logical_operations"],
+                                views["lo_index"])
+
+    def _count(self, text_logical_operations):
+        """
+        adds the occurrences of a new text to the histogram counts
+        """
+        unique, first_index, counts = np.unique(text_logical_operations, return_index=True, return_counts=True)
+        unique = unique.tolist()
+        rows = self.histogram_rows
+        is_new = np.array([logical_operation not in rows for logical_operation in unique], dtype=bool)
+        if is_new.any():
+            # rows of the histogram are ordered by first occurrence in the texts
+            new_logical_operations = np.asarray(unique)[is_new][np.argsort(first_index[is_new])].tolist()
+            size = len(self.histogram_order)
+            self.counts = _grow(self.counts, size, size + len(new_logical_operations))
+            self.counts[size : size + len(new_logical_operations)] = 0
+            for row, logical_operation in enumerate(new_logical_operations, size):
+                rows[logical_operation] = row
+            self.histogram_order.extend(new_logical_operations)
+
+        self.counts[[rows[logical_operation] for logical_operation in unique]] += counts
+
+    def get_counts(self):
+        """
+        :return: the occurrences of the logical operations of histogram_order
+        """
+        return self.counts[:len(self.histogram_order)]
 
     def get_histogram(self):
         """
@@ -88,13 +676,10 @@ class User():
         1          (s3, s4)                 29          0.29            user_1
 
         """
-        import collections
-        self.histogram = collections.Counter()
-        for text_logical_operations in self.texts_logical_operations:
-            cur_hist = collections.Counter(text_logical_operations)
-            self.histogram.update(cur_hist)
-
-        df_histogram = pd.DataFrame(list(self.histogram.items()), columns = ["logical_operation", "cnt"])
+        import pandas as pd
+        logical_operations = np.array(self.histogram_order, dtype=np.int64)
+        df_histogram = pd.DataFrame({"logical_operation" : self.symbols.decode_logical_operations(logical_operations),
+                                     "cnt" : self.get_counts()})
         df_histogram["percentage"] = df_histogram["cnt"]/df_histogram["cnt"].sum()
         df_histogram["user_id"] = self.user_id
 
@@ -127,62 +712,206 @@ class User():
             6         (a, b)            b           6           1
 
         """
-        logical_operations_locations = list()
-        full_logical_operations_locations = list()
-        total_len = 0
-        for logical_operation_occ in text_logical_operations:
-            begin_index_in_text = total_len
-            size = len(logical_operation_occ)
-            end_index_in_text = begin_index_in_text + size - 1 # end_index is inclusive
-
-            logical_operations_locations.append([logical_operation_occ, begin_index_in_text, end_index_in_text])
-
-            lo_full = pd.DataFrame([  [logical_operation_occ] * size,
-                                      list(logical_operation_occ),
-                            list(range(begin_index_in_text, begin_index_in_text + size)),
-                            list(range(size))]).T
-            full_logical_operations_locations.append(lo_full)
-
-            total_len += size
-
-        df_logical_operations_locations = pd.DataFrame(logical_operations_locations, columns = ["logical_operation", "begin_index", "end_index"])
-
-        full_logical_operations_locations = pd.concat(full_logical_operations_locations)
-        full_logical_operations_locations.columns = ["logical_operation","text", "text_index","lo_index"]
-        full_logical_operations_locations.reset_index(inplace=True, drop=True)
-
-        return df_logical_operations_locations, full_logical_operations_locations
+        text_logical_operations_ids = [self.symbols.logical_operation_id(lo) for lo in text_logical_operations]
+        return self.symbols.decode_locations(self.symbols.get_locations(text_logical_operations_ids))
+
+# distributions of the scores of generate_population, by name: function(random_state, size, **parameters)
+SCORE_DISTRIBUTIONS = {
+    "constant" : lambda random_state, size, value=1.0 : np.full(size, float(value)),
+    "uniform" : lambda random_state, size, low=1.0, high=100.0 : random_state.uniform(low, high, size),
+    "lognormal" : lambda random_state, size, mean=0.0, sigma=1.0 : random_state.lognormal(mean, sigma, size),
+    # the score of the logical operation of rank r (in a random order per user) is 1 / r**a
+    "zipf" : lambda random_state, size, a=1.0 : 1.0 / random_state.permutation(np.arange(1, size + 1)) ** a,
+}
+
+def population_scores(random_state, size, distribution="constant", **parameters):
+    """
+    :param random_state: np.random.Generator
+    :param distribution: name in SCORE_DISTRIBUTIONS, the other parameters are passed to it
+    :return: list of #size positive float scores
+    """
+    assert distribution in SCORE_DISTRIBUTIONS, "unknown scores distribution {}, use one of {}".format(distribution, list(SCORE_DISTRIBUTIONS))
+    scores = SCORE_DISTRIBUTIONS[distribution](random_state, size, **parameters)
+    assert np.all(scores > 0)
+    return scores.tolist()
 
 class Simulator():
-    def __init__(self):
+    def __init__(self, seed=0, per_user_streams=False, store=None, retention=RETAIN_ALL):
+        """
+        :param seed: seed of the global random state, or of the users' streams
+        :param per_user_streams: if True every user draws from its own np.random.Generator (see user_random_state),
+                                 which is required to generate texts in parallel (generate_texts_for_users)
+        :param store: a directory (or a TextStore.TextStore) to spill the generated texts to memory mapped files.
+                      the text entries then hold views of the files and no location frames (see get_full_locations)
+        :param retention: RETAIN_ALL, RETAIN_COUNTS or RETAIN_NONE
+        """
+        assert retention in RETENTIONS
+        self.seed = seed
+        self.per_user_streams = per_user_streams
+        self.retention = retention
+        self.store = TextStore.TextStore(store) if isinstance(store, str) else store
         self.users = dict()
         self.text_entries = list()
+        self.symbols = SymbolTable()
+        self.user_filter = None # optional function of user_id, the bulk commands skip the users it is False for (see Shards)
 
-        np.random.seed(0)
+        np.random.seed(seed)
+
+    def __getstate__(self):
+        """
+        a simulator is pickled with the global random state, so the restored one goes on drawing the same texts
+        (see Cache.CheckpointStore). its TextStore is not: the users keep no views of it unless they retain
+        every text, and the restored simulator appends to the store given to set_store
+        """
+        assert self.store is None or self.retention != RETAIN_ALL, "the texts of a TextStore can not be pickled"
+        state = dict(self.__dict__)
+        state["store"] = None
+        state["global_random_state"] = np.random.get_state()
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        np.random.set_state(state.pop("global_random_state"))
+        self.__dict__.update(state)
+
+    def set_store(self, store):
+        """
+        :param store: the TextStore.TextStore the next texts are appended to, or None to keep them in RAM
+        """
+        self.store = store
+        for user in self.users.values():
+            user.store = store
+
+    def _selected(self, user_id):
+        return self.user_filter is None or self.user_filter(user_id)
 
     def _user_exists(self, user_id):
         return user_id in self.users.keys()
 
     def add_user(self, user_id):
         assert not self._user_exists(user_id)
-        self.users[user_id] = User(user_id=user_id)
+        random_state = user_random_state(self.seed, user_id) if self.per_user_streams else None
+        self.users[user_id] = User(user_id=user_id, symbols=self.symbols, random_state=random_state, store=self.store,
+                                   retention=self.retention)
+
+    def add_users(self, users):
+        """
+        :param users: iterable of (user_id, session_id or None), e.g. a generator over a range of ids
+        """
+        for user_id, session_id in users:
+            if not self._selected(user_id):
+                continue
+            self.add_user(user_id)
+            if session_id is not None:
+                self.set_session(user_id, session_id)
+
+    def iter_population(self, users, logical_operations, vocabulary_size=None, scores=None, text_size=None, seed=0):
+        """
+        adds the users one at a time, each with its own vocabulary drawn from a template, and optionally a first text.
+        yields after every user (skipped ones too, see user_filter), so the caller can stream out the texts generated so far.
+        the vocabularies are drawn from their own random stream (of the simulator seed and seed),
+        so a population does not change the texts drawn from the global random state.
+        :param users: iterable of (user_id, session_id or None)
+        :param logical_operations: the template, a list of tuples of letters
+        :param vocabulary_size: number of logical operations of every user, drawn from the template without replacement.
+                                default: the whole template
+        :param scores: dict of the scores distribution, {"distribution" : name, parameters...} (see population_scores)
+        :param text_size: if not None, generate a text of this size for every user
+        """
+        logical_operations = list(logical_operations)
+        vocabulary_size = len(logical_operations) if vocabulary_size is None else vocabulary_size
+        assert 0 < vocabulary_size <= len(logical_operations)
+        scores = dict() if scores is None else scores
+        random_state = np.random.Generator(np.random.PCG64(np.random.SeedSequence([self.seed, seed])))
+
+        for user_id, session_id in users:
+            if vocabulary_size < len(logical_operations):
+                chosen = random_state.choice(len(logical_operations), size=vocabulary_size, replace=False)
+                vocabulary = [logical_operations[i] for i in chosen]
+            else:
+                vocabulary = logical_operations
+            vocabulary_scores = population_scores(random_state, vocabulary_size, **scores)
+            if self._selected(user_id): # the vocabulary of a skipped user is drawn all the same, to keep the stream
+                self.add_users([(user_id, session_id)])
+                self.users[user_id].add_logical_operations(vocabulary, vocabulary_scores)
+                if text_size is not None:
+                    self.generate_text_for_user(user_id, text_size)
+            yield user_id
+
+    def generate_population(self, users, logical_operations, vocabulary_size=None, scores=None, text_size=None, seed=0):
+        """
+        see iter_population
+        """
+        for _ in self.iter_population(users, logical_operations, vocabulary_size=vocabulary_size, scores=scores,
+                                      text_size=text_size, seed=seed):
+            pass
 
     def add_logical_opration_to_user(self, user_id, logical_operation, score):
         assert self._user_exists(user_id)
         user = self.users[user_id]
         user.add_logical_operation(logical_operation, score)
 
+    def add_logical_operations_to_user(self, user_id, logical_operations, scores):
+        assert self._user_exists(user_id)
+        user = self.users[user_id]
+        user.add_logical_operations(logical_operations, scores)
+
     def del_logical_operation_from_user(self, user_id, logical_operation):
         assert self._user_exists(user_id)
         user = self.users[user_id]
         user.del_logical_operation(logical_operation)
 
+    def add_transition_to_user(self, user_id, from_logical_operation, to_logical_operation, score):
+        assert self._user_exists(user_id)
+        user = self.users[user_id]
+        user.add_transition(from_logical_operation, to_logical_operation, score)
+
+    def del_transition_from_user(self, user_id, from_logical_operation, to_logical_operation):
+        assert self._user_exists(user_id)
+        user = self.users[user_id]
+        user.del_transition(from_logical_operation, to_logical_operation)
+
     def generate_text_for_user(self, user_id, text_size_logical_operations):
         assert self._user_exists(user_id)
         user = self.users[user_id]
         text_entry = user.generate_text(text_size_logical_operations)
         self.text_entries.append(text_entry)
 
+    def generate_texts_for_users(self, requests, executor=None):
+        """
+        generates several texts, the same as calling generate_text_for_user for each request in order.
+        the texts of different users are sampled concurrently by the executor (e.g. a ProcessPoolExecutor).
+        the users' vocabularies and sessions must not change between the requests.
+        :param requests: list of (user_id, text_size_logical_operations)
+        :param executor: a concurrent.futures.Executor, or None to sample in this process
+        """
+        if executor is None or len(requests) <= 1:
+            for user_id, text_size_logical_operations in requests:
+                self.generate_text_for_user(user_id, text_size_logical_operations)
+            return
+
+        assert self.per_user_streams, "parallel generation requires per_user_streams"
+        sizes = dict() # user_id to the list of its texts sizes, in requests order
+        for user_id, text_size_logical_operations in requests:
+            assert self._user_exists(user_id)
+            sizes.setdefault(user_id, list()).append(text_size_logical_operations)
+
+        futures = dict()
+        for user_id, user_sizes in sizes.items():
+            user = self.users[user_id]
+            futures[user_id] = executor.submit(_sample_texts, user.get_sampler(),
+                                               user.random_state.bit_generator.state, user_sizes)
+
+        texts_logical_operations = dict()
+        for user_id, future in futures.items():
+            texts_logical_operations[user_id], state = future.result()
+            self.users[user_id].random_state.bit_generator.state = state
+            texts_logical_operations[user_id].reverse() # consumed from the end, in requests order
+
+        for user_id, _ in requests:
+            text_entry = self.users[user_id].add_text(texts_logical_operations[user_id].pop())
+            self.text_entries.append(text_entry)
+
     def set_session(self, user_id, session_id):
         assert self._user_exists(user_id)
         user = self.users[user_id]
@@ -191,6 +920,26 @@ class Simulator():
     def get_text_entries(self):
         return self.text_entries
 
+    def iter_text_entries(self, flush=None):
+        """
+        yields the text entries lazily, including the ones generated while iterating.
+        :param flush: drop every entry from the simulator once it is yielded, so the consumer holds the only reference.
+                      default: only with RETAIN_NONE
+        """
+        if flush is None:
+            flush = self.retention == RETAIN_NONE
+        if not flush:
+            index = 0
+            while index < len(self.text_entries):
+                yield self.text_entries[index]
+                index += 1
+            return
+        while self.text_entries:
+            text_entries, self.text_entries = self.text_entries, list()
+            text_entries.reverse()
+            while text_entries:
+                yield text_entries.pop()
+
     def clear(self):
         self.text_entries = list() # users stays
 
@@ -205,8 +954,32 @@ class Simulator():
         0      (s4, s5, s6)         100     1.000000    user_2
         """
 
-        df_histogram = pd.concat([user.get_histogram() for user in self.users.values()])
-        df_histogram.sort_values(by=["user_id", "logical_operation"], inplace=True)
-        return df_histogram
+        if not self.users:
+            import pandas as pd
+            return pd.DataFrame(columns=self.histogram_columns)
+        return self.get_histogram_table().to_frame()
 
+    histogram_columns = ["logical_operation", "cnt", "percentage", "user_id"]
 
+    def get_histogram_table(self):
+        """
+        :return: the rows of get_histogram as a Table.Table, made without pandas
+        """
+        if not self.users:
+            return Table.Table({name : np.zeros(0, dtype=object) for name in self.histogram_columns}, 0)
+
+        # one table from the users' counts arrays, the same as concatenating User.get_histogram of every user
+        users = list(self.users.values())
+        orders = [np.array(user.histogram_order, dtype=np.int64) for user in users]
+        counts = [user.get_counts() for user in users]
+        user_ids = itertools.chain.from_iterable(itertools.repeat(user.user_id, len(order)) for user, order in zip(users, orders))
+        logical_operations = np.concatenate(orders)
+        histogram = Table.Table({"logical_operation" : self.symbols.decode_logical_operations(logical_operations),
+                                 "cnt" : np.concatenate(counts),
+                                 "percentage" : np.concatenate([c / c.sum() for c in counts]),
+                                 "user_id" : _object_array(list(user_ids))},
+                                len(logical_operations),
+                                index=np.concatenate([np.arange(len(order)) for order in orders]))
+        # sorted by user_id and logical_operation, as DataFrame.sort_values sorts them
+        keys = list(zip(histogram.data["user_id"].tolist(), histogram.data["logical_operation"].tolist()))
+        return histogram.take(sorted(range(len(keys)), key=keys.__getitem__))
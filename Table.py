@@ -0,0 +1,93 @@
+"""
+A table of equal length columns (numpy arrays, or scalars repeated on every row) with the part of the
+pandas DataFrame interface the outputs use: len, columns, [name], [list of names], [name] = value and to_csv.
+The csv outputs are written from tables without importing pandas, which takes longer to import than the
+simulation of a small scenario. to_frame makes the DataFrame, for the outputs and callers that need one.
+"""
+
+import csv
+import io
+import itertools
+import numpy as np
+import os
+
+def _is_scalar(value):
+    return np.ndim(value) == 0
+
+class Table():
+    def __init__(self, columns, size, index=None):
+        """
+        :param columns: dict of column name to an array of #size values, or to a scalar
+        :param index: array of the #size row labels, default: 0, 1, ..., size-1
+        """
+        self.data = dict(columns)
+        self.size = size
+        self.index = index
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def columns(self):
+        return list(self.data)
+
+    def __getitem__(self, key):
+        """
+        :param key: a column name, or a list of names
+        :return: the column as an array (scalars are repeated), or a table of the listed columns in their order
+        """
+        if isinstance(key, list):
+            return __class__({name : self.data[name] for name in key}, self.size, index=self.index)
+        value = self.data[key]
+        if _is_scalar(value):
+            return np.full(self.size, value)
+        return np.asarray(value)
+
+    def __setitem__(self, name, value):
+        self.data[name] = value
+
+    def take(self, order):
+        """
+        :param order: array of row positions
+        :return: a table of the rows in that order, labels included
+        """
+        order = np.asarray(order, dtype=np.int64)
+        index = np.arange(self.size, dtype=np.int64) if self.index is None else np.asarray(self.index)
+        data = {name : value if _is_scalar(value) else np.asarray(value)[order] for name, value in self.data.items()}
+        return __class__(data, len(order), index=index[order])
+
+    def to_frame(self):
+        import pandas as pd # only the callers asking for a DataFrame pay for importing pandas
+        index = pd.RangeIndex(self.size) if self.index is None else self.index
+        return pd.DataFrame(self.data, index=index, columns=self.columns)
+
+    def _values(self, value):
+        if _is_scalar(value):
+            return itertools.repeat(value, self.size)
+        return value.tolist() if hasattr(value, "tolist") else list(value)
+
+    def to_csv(self, path_or_buf=None, index=True, header=True):
+        """
+        writes the same csv as DataFrame.to_csv with these arguments: python's csv module quoting,
+        str of the values (e.g. of the logical operations tuples) and empty fields for None
+        :param path_or_buf: a file path, an open text file, or None to return the csv as a string
+        """
+        if path_or_buf is None:
+            buffer = io.StringIO()
+            self._write_csv(buffer, index, header)
+            return buffer.getvalue()
+        if isinstance(path_or_buf, str):
+            with open(path_or_buf, "w", newline="") as f:
+                self._write_csv(f, index, header)
+        else:
+            self._write_csv(path_or_buf, index, header)
+
+    def _write_csv(self, f, index, header):
+        writer = csv.writer(f, lineterminator=os.linesep)
+        if header:
+            writer.writerow(([""] if index else []) + self.columns)
+        values = [self._values(value) for value in self.data.values()]
+        if index:
+            labels = range(self.size) if self.index is None else self._values(self.index)
+            values.insert(0, labels)
+        writer.writerows(zip(*values))
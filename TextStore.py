@@ -0,0 +1,64 @@
+import numpy as np
+import os
+
+class TextStore():
+    """
+    Append-only on-disk store of the generated texts, as int32 arrays in memory mapped files (one file per column).
+    append returns views into the mapped files, so texts and their locations do not stay in RAM.
+    The files grow by doubling, and are mapped again only when they grow, so few maps are alive at a time.
+    """
+    columns = ["letters", "letters_logical_operations", "lo_index", "logical_operations"]
+    dtype = np.dtype(np.int32)
+
+    def __init__(self, dirpath, initial_capacity=1 << 20):
+        self.dirpath = dirpath
+        self.initial_capacity = initial_capacity
+        os.makedirs(dirpath, exist_ok=True)
+
+        self.sizes = {name : 0 for name in self.columns} # number of values appended to the column
+        self.capacities = {name : 0 for name in self.columns}
+        self.maps = {name : None for name in self.columns}
+        for name in self.columns:
+            open(self.path(name), "wb").close()
+
+    def path(self, name):
+        return os.path.join(self.dirpath, name + ".int32")
+
+    def _reserve(self, name, n):
+        size, capacity = self.sizes[name], self.capacities[name]
+        if size + n <= capacity:
+            return
+        capacity = max(2 * capacity, size + n, self.initial_capacity)
+        if self.maps[name] is not None:
+            self.maps[name].flush()
+        with open(self.path(name), "r+b") as f:
+            f.truncate(capacity * self.dtype.itemsize)
+        self.maps[name] = np.memmap(self.path(name), dtype=self.dtype, mode="r+", shape=(capacity,))
+        self.capacities[name] = capacity
+
+    def _append(self, name, array):
+        array = np.asarray(array)
+        n = len(array)
+        self._reserve(name, n)
+        begin = self.sizes[name]
+        view = self.maps[name][begin : begin + n]
+        view[:] = array
+        self.sizes[name] = begin + n
+        return view
+
+    def append(self, letters, letters_logical_operations, lo_index, logical_operations):
+        """
+        :return: dict of the views of the stored arrays, by column name
+        """
+        return {"letters" : self._append("letters", letters),
+                "letters_logical_operations" : self._append("letters_logical_operations", letters_logical_operations),
+                "lo_index" : self._append("lo_index", lo_index),
+                "logical_operations" : self._append("logical_operations", logical_operations)}
+
+    def flush(self):
+        for mapped in self.maps.values():
+            if mapped is not None:
+                mapped.flush()
+
+    def nbytes(self):
+        return sum(self.sizes.values()) * self.dtype.itemsize
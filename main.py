@@ -1,21 +1,73 @@
+"""
+Command line entry point:
+    python main.py                                        runs the scenarios s1 s2 s3 s4 to out/
+    python main.py run [scenario names] [options]         runs scenarios, the same as Runner.py (see python main.py run --help)
+    python main.py validate [scenario names or files]     parses and validates scenario files, without simulating them
+    python main.py list                                   lists the scenario files under --dirin
+The modules are imported by the subcommand that needs them: validate and list do not import numpy,
+and run imports pandas only for outputs built as DataFrames (see Table).
+"""
 
+import argparse
 import os
-import Executer
-if __name__ == "__main__":
+import sys
+
+DEFAULT_ARGV = ["run", "s1", "s2", "s3", "s4"]
+
+def _scenario_path(dirin, scenario):
+    return scenario if os.path.isfile(scenario) else os.path.join(dirin, scenario)
+
+def _scenario_names(dirin, scenarios):
+    return scenarios or sorted(os.listdir(dirin))
+
+def validate(filepaths):
+    """
+    parses every scenario file, with the validation of Parser.iter_file
+    :return: the number of invalid files
+    """
+    import Parser
+    parser = Parser.Parser()
+    invalid = 0
+    for filepath in filepaths:
+        try:
+            count = sum(1 for _ in parser.iter_file(filepath))
+            print("[{}] ok, {} commands".format(filepath, count))
+        except Exception as e:
+            invalid += 1
+            print("[{}] invalid: {}: {}".format(filepath, type(e).__name__, e))
+    return invalid
 
-    root_dirout = r"out"
-    dirin_scenarios = "scenarios"
-    
-    exclude = []
-    include = ["s1","s2","s3","s4"]
-    scenarios = os.listdir(dirin_scenarios)
-    scenarios = [s for s in scenarios if s not in exclude]
-    scenarios = [s for s in scenarios if s in include]
-
-    for scenario_name in scenarios:
-        print(scenario_name)
-    
-        dirout = os.path.join(root_dirout, "case_{}".format(scenario_name))
-        Executer.Executer.execute(filepath_in=os.path.join(dirin_scenarios, scenario_name),
-                                  dirout=dirout)
-        print()
+def list_scenarios(dirin):
+    for name in sorted(os.listdir(dirin)):
+        filepath = os.path.join(dirin, name)
+        if os.path.isfile(filepath):
+            print("{:<24} {:>12,} bytes".format(name, os.path.getsize(filepath)))
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    argv = argv or DEFAULT_ARGV
+
+    parser = argparse.ArgumentParser(description="PA simulator")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    # the arguments of run are parsed by Runner.main, including --help
+    subparsers.add_parser("run", add_help=False, help="run scenarios (the options of Runner.py)")
+    validate_parser = subparsers.add_parser("validate", help="parse and validate scenario files")
+    validate_parser.add_argument("scenarios", nargs="*", help="scenario names or file paths, default: all files under --dirin")
+    list_parser = subparsers.add_parser("list", help="list the scenario files")
+    for subparser in [validate_parser, list_parser]:
+        subparser.add_argument("--dirin", default="scenarios")
+    args, rest = parser.parse_known_args(argv)
+
+    if args.command == "run":
+        import Runner
+        return Runner.main(rest)
+    if rest:
+        parser.error("unrecognized arguments: {}".format(" ".join(rest)))
+    if args.command == "validate":
+        filepaths = [_scenario_path(args.dirin, scenario) for scenario in _scenario_names(args.dirin, args.scenarios)]
+        return 1 if validate(filepaths) else 0
+    list_scenarios(args.dirin)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,18 @@
+"""
+Helpers shared by the tests
+"""
+
+import csv
+import os
+
+def read_csv_outputs(dirout):
+    """
+    :return: the csv outputs of a run, without the TIMESTAMP column of data.csv (the 4th, the time of the run),
+             to compare runs of the same scenario
+    """
+    with open(os.path.join(dirout, "data.csv"), newline="") as f:
+        outputs = {"data.csv" : [row[:3] + row[4:] for row in csv.reader(f)]}
+    for name in ["info.csv", "hist.csv"]:
+        with open(os.path.join(dirout, name), "rb") as f:
+            outputs[name] = f.read()
+    return outputs
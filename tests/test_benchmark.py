@@ -0,0 +1,6 @@
+import Benchmark
+
+def test_users_case_generates_a_text_for_every_user():
+    case = [case for case in Benchmark.default_cases(quick=True) if case.name == "users=10"][0]
+    generated = {command["data"]["user_id"] for command in case.make_scenario() if command["operation"] == "generate_text"}
+    assert generated == {"user_{}".format(u) for u in range(10)}
@@ -0,0 +1,41 @@
+import json
+import os
+import Cache
+import Executer
+
+SCENARIO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scenarios", "s1")
+
+def read_outputs(dirout):
+    return {name : open(os.path.join(dirout, name), "rb").read() for name in ["data.csv", "info.csv", "hist.csv"]}
+
+def cache_status(dirout):
+    with open(os.path.join(dirout, "report.json")) as f:
+        records = json.load(f)["records"]
+    return [record["cache"] for record in records if record["stage"] == "execute"][0]
+
+def test_cache_hit_reproduces_the_outputs(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    Executer.Executer.execute(SCENARIO, str(tmp_path / "first"), cache_dir=cache_dir)
+    Executer.Executer.execute(SCENARIO, str(tmp_path / "second"), cache_dir=cache_dir)
+    assert cache_status(str(tmp_path / "first")) == "miss"
+    assert cache_status(str(tmp_path / "second")) == "hit"
+    assert read_outputs(str(tmp_path / "second")) == read_outputs(str(tmp_path / "first"))
+
+def test_cache_misses_on_another_seed_or_option(tmp_path):
+    key = Cache.scenario_key(SCENARIO, 0, output_format="csv")
+    assert key == Cache.scenario_key(SCENARIO, 0, output_format="csv")
+    assert key != Cache.scenario_key(SCENARIO, 1, output_format="csv")
+    assert key != Cache.scenario_key(SCENARIO, 0, output_format="parquet")
+
+def test_cache_evicts_the_least_recently_used(tmp_path):
+    cache = Cache.ResultCache(str(tmp_path / "cache"), max_bytes=2500)
+    for i, key in enumerate(["a", "b", "c"]):
+        dirout = tmp_path / "out_{}".format(key)
+        dirout.mkdir()
+        (dirout / "data.csv").write_bytes(b"x" * 1000)
+        cache.put(key, str(dirout))
+        os.utime(cache.path(key), (i, i)) # distinct last use times
+        if key == "b":
+            assert cache.get("a", str(tmp_path / "hit")) # a is used after b
+    assert not os.path.exists(cache.path("b"))
+    assert os.path.exists(cache.path("a")) and os.path.exists(cache.path("c"))
@@ -0,0 +1,38 @@
+import os
+import Cache
+import Executer
+from helpers import read_csv_outputs
+
+SCENARIOS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scenarios")
+
+def run_with_checkpoints(scenario, dirout, checkpoints, store=None):
+    executer = Executer.Executer(store=store, retention=Executer.Simulator.RETAIN_COUNTS)
+    executer.writer = Executer.DataWriter(dirout=dirout, symbols=executer.simulator.symbols)
+    executer.execute_with_checkpoints(os.path.join(SCENARIOS, scenario), checkpoints, per_user_streams=False)
+    executer.writer.close(histogram=executer.simulator.get_histogram_table())
+
+def test_resumed_prefix_reproduces_the_outputs(tmp_path):
+    # s3 shares its first commands with s2
+    checkpoints = Cache.CheckpointStore(str(tmp_path / "checkpoints"), min_seconds=0) # a checkpoint after every command
+    run_with_checkpoints("s2", str(tmp_path / "s2"), checkpoints)
+    run_with_checkpoints("s3", str(tmp_path / "resumed"), checkpoints)
+    Executer.Executer.execute(os.path.join(SCENARIOS, "s3"), str(tmp_path / "fresh"))
+    assert read_csv_outputs(str(tmp_path / "resumed")) == read_csv_outputs(str(tmp_path / "fresh"))
+
+def test_texts_are_saved_once_along_the_checkpoints(tmp_path):
+    checkpoints = Cache.CheckpointStore(str(tmp_path / "checkpoints"), min_seconds=0)
+    run_with_checkpoints("s2", str(tmp_path / "first"), checkpoints)
+    run_with_checkpoints("s2", str(tmp_path / "resumed"), checkpoints)
+    assert read_csv_outputs(str(tmp_path / "resumed")) == read_csv_outputs(str(tmp_path / "first"))
+
+    keys = [key for _, _, key in checkpoints.entries()]
+    texts = sum(os.path.getsize(checkpoints.texts_path(key)) for key in keys)
+    assert len(keys) > 2
+    assert texts < 2 * os.path.getsize(str(tmp_path / "first" / "data.csv"))
+
+def test_checkpoints_with_a_text_store(tmp_path):
+    checkpoints = Cache.CheckpointStore(str(tmp_path / "checkpoints"), min_seconds=0)
+    run_with_checkpoints("s2", str(tmp_path / "s2"), checkpoints, store=str(tmp_path / "store_s2"))
+    run_with_checkpoints("s3", str(tmp_path / "resumed"), checkpoints, store=str(tmp_path / "store_s3"))
+    Executer.Executer.execute(os.path.join(SCENARIOS, "s3"), str(tmp_path / "fresh"))
+    assert read_csv_outputs(str(tmp_path / "resumed")) == read_csv_outputs(str(tmp_path / "fresh"))
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+import Simulator
+
+def baseline_get_locations(text_logical_operations):
+    """
+    User.get_locations before it was vectorized over ids, the reference of the tests below
+    """
+    logical_operations_locations = list()
+    full_logical_operations_locations = list()
+    total_len = 0
+    for logical_operation_occ in text_logical_operations:
+        begin_index_in_text = total_len
+        size = len(logical_operation_occ)
+        end_index_in_text = begin_index_in_text + size - 1 # end_index is inclusive
+
+        logical_operations_locations.append([logical_operation_occ, begin_index_in_text, end_index_in_text])
+
+        lo_full = pd.DataFrame([  [logical_operation_occ] * size,
+                                  list(logical_operation_occ),
+                        list(range(begin_index_in_text, begin_index_in_text + size)),
+                        list(range(size))]).T
+        full_logical_operations_locations.append(lo_full)
+
+        total_len += size
+
+    df_logical_operations_locations = pd.DataFrame(logical_operations_locations, columns = ["logical_operation", "begin_index", "end_index"])
+
+    full_logical_operations_locations = pd.concat(full_logical_operations_locations)
+    full_logical_operations_locations.columns = ["logical_operation","text", "text_index","lo_index"]
+    full_logical_operations_locations.reset_index(inplace=True, drop=True)
+
+    return df_logical_operations_locations, full_logical_operations_locations
+
+def random_text(random_state, size, vocabulary_size=20, max_length=5, alphabet_size=8):
+    vocabulary = [tuple("s{}".format(letter) for letter in random_state.randint(alphabet_size, size=length))
+                  for length in random_state.randint(1, max_length + 1, size=vocabulary_size)]
+    return [vocabulary[i] for i in random_state.randint(vocabulary_size, size=size)]
+
+def assert_same_frames(expected, actual):
+    assert list(actual.columns) == list(expected.columns)
+    assert list(actual.index) == list(expected.index)
+    for column in expected.columns:
+        assert actual[column].tolist() == expected[column].tolist(), column
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("size", [1, 2, 50, 1000])
+def test_get_locations_matches_baseline(seed, size):
+    text_logical_operations = random_text(np.random.RandomState(seed), size)
+    user = Simulator.User("user_1")
+    expected = baseline_get_locations(text_logical_operations)
+    actual = user.get_locations(text_logical_operations)
+    assert_same_frames(expected[0], actual[0])
+    assert_same_frames(expected[1], actual[1])
+
+def test_get_locations_single_letter_operations():
+    text_logical_operations = [("a",), ("b",), ("a",), ("c", "d"), ("a",)]
+    user = Simulator.User("user_1")
+    expected = baseline_get_locations(text_logical_operations)
+    actual = user.get_locations(text_logical_operations)
+    assert_same_frames(expected[0], actual[0])
+    assert_same_frames(expected[1], actual[1])
+
+def test_get_locations_empty_text():
+    # the baseline fails on an empty text (pd.concat of no frames): the frames are empty, with the same columns
+    df_basic, df_full = Simulator.User("user_1").get_locations([])
+    assert list(df_basic.columns) == ["logical_operation", "begin_index", "end_index"]
+    assert list(df_full.columns) == ["logical_operation", "text", "text_index", "lo_index"]
+    assert len(df_basic) == 0 and len(df_full) == 0
+
+def test_symbol_table_get_locations_over_ids():
+    symbols = Simulator.SymbolTable()
+    text_logical_operations = random_text(np.random.RandomState(7), 200)
+    ids = [symbols.logical_operation_id(lo) for lo in text_logical_operations]
+    df_basic, df_full = symbols.decode_locations(symbols.get_locations(ids))
+    expected = baseline_get_locations(text_logical_operations)
+    assert_same_frames(expected[0], df_basic)
+    assert_same_frames(expected[1], df_full)
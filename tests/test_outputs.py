@@ -0,0 +1,80 @@
+import os
+import pandas as pd
+import pytest
+import threading
+import Executer
+import FakeColumns
+import Parser
+import Simulator
+from helpers import read_csv_outputs
+
+def make_simulator(users=3, texts=2, text_size=50):
+    simulator = Simulator.Simulator(seed=0)
+    for u in range(users):
+        user_id = "user_{}".format(u)
+        simulator.add_user(user_id)
+        simulator.set_session(user_id, "S{}".format(u))
+        simulator.add_logical_operations_to_user(user_id, [("a", "b"), ("c",), ("d", "e", "f")], [1.0, 2.0, 3.0])
+    for t in range(texts):
+        for u in range(users):
+            simulator.generate_text_for_user("user_{}".format(u), text_size)
+    return simulator
+
+def test_data_columnar_output_starts_from_unused_fake_columns(tmp_path):
+    pytest.importorskip("pyarrow")
+    fake_columns = FakeColumns.default_fake_columns()
+    fake_columns[0] = FakeColumns.TimestampColumn("TIMESTAMP", start=0, session_gap=3600)
+    data = Executer.Data(make_simulator(), fake_columns=fake_columns)
+    data.write(str(tmp_path / "csv"))
+    data.write(str(tmp_path / "parquet"), output_format="parquet")
+    timestamps = pd.read_parquet(str(tmp_path / "parquet" / "data.parquet"))["TIMESTAMP"].tolist()
+    assert timestamps == data.data_table["TIMESTAMP"].tolist()
+    assert timestamps[0] == FakeColumns.format_local_time([0])[0]
+
+class CallerThreadSymbols(Simulator.SymbolTable):
+    """
+    fails when the symbols are read by another thread than the one interning them
+    """
+    def decoding_array(self, name):
+        assert threading.current_thread() is threading.main_thread(), "symbols decoded on the {} thread".format(threading.current_thread().name)
+        return super().decoding_array(name)
+
+def test_pipelined_population_matches_the_sequential_outputs(tmp_path):
+    # the chunks are assembled on another thread while the next users intern new symbols
+    scenario = str(tmp_path / "population.jsonl")
+    template = [["s{}".format(i), "s{}".format(i + 1), "s{}".format(3 * i)] for i in range(2000)]
+    Parser.write_jsonl([{"operation" : "generate_population",
+                         "data" : {"users" : {"prefix" : "user_", "count" : 300, "session_id" : "S{i}"},
+                                   "logical_operations" : template, "vocabulary_size" : 10,
+                                   "scores" : {"distribution" : "zipf", "a" : 1.2}, "text_size" : 30}}], scenario)
+    Executer.Executer.execute(scenario, str(tmp_path / "sequential"))
+
+    executer = Executer.Executer(retention=Simulator.RETAIN_COUNTS)
+    executer.simulator.symbols.__class__ = CallerThreadSymbols
+    executer.writer = Executer.DataWriter(dirout=str(tmp_path / "pipelined"), symbols=executer.simulator.symbols, pipelined=True)
+    executer.execute_from_file(scenario)
+    executer.writer.close(histogram=executer.simulator.get_histogram_table())
+    assert read_csv_outputs(str(tmp_path / "pipelined")) == read_csv_outputs(str(tmp_path / "sequential"))
+
+def open_files(dirpath):
+    fds = "/proc/self/fd"
+    return [path for path in (os.path.realpath(os.path.join(fds, fd)) for fd in os.listdir(fds))
+            if path.startswith(os.path.realpath(dirpath))]
+
+@pytest.mark.parametrize("output_format", ["csv", "parquet", "npy"])
+def test_failed_pipelined_scenario_leaves_no_threads_or_open_files(output_format, tmp_path):
+    if output_format == "parquet":
+        pytest.importorskip("pyarrow")
+    if not os.path.isdir("/proc/self/fd"):
+        pytest.skip("lists the open files with /proc")
+    scenario = str(tmp_path / "failing.jsonl")
+    Parser.write_jsonl([{"operation" : "add_user", "data" : {"user_id" : "u1"}},
+                        {"operation" : "set_session", "data" : {"user_id" : "u1", "session_id" : "S1"}},
+                        {"operation" : "add_logical_operations", "data" : {"user_id" : "u1", "logical_operations" : [("a", "b")], "score" : 1.0}},
+                        {"operation" : "generate_text", "data" : {"user_id" : "u1", "text_size" : 100}},
+                        {"operation" : "generate_text", "data" : {"user_id" : "unknown", "text_size" : 100}}], scenario)
+    threads = threading.active_count()
+    with pytest.raises(AssertionError):
+        Executer.Executer.execute(scenario, str(tmp_path / "out"), output_format=output_format, pipelined=True)
+    assert threading.active_count() == threads
+    assert open_files(str(tmp_path / "out")) == []
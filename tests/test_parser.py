@@ -0,0 +1,92 @@
+import ast
+import itertools
+import pytest
+import Parser
+import Simulator
+
+@pytest.mark.parametrize("text", ["{'operation': 'add_user', 'data': {'user_id': 'u1'}}",
+                                  "{'operation': 'x', 'data': {'logical_operation': ('a', 'b'), 'score': 1.5}}",
+                                  "{'operation': 'x', 'data': {'logical_operation': ['a', 'b']}}",
+                                  "{'operation': 'x', 'data': {'logical_operations': [('a', 'b'), ('c', 'd', 'e')]}}",
+                                  "{'operation': 'x', 'data': {'nested': (('a', 'b'), ['c'], ('d', ('e', 'f')))}}",
+                                  "{'operation': 'x', 'data': {'single': ('a',), 'grouped': ('a'), 'number': (5)}}",
+                                  "{'operation': 'x', 'data': {'empty': (), 'list': []}}",
+                                  "{'operation': 'x', 'data': {'score': NaN}}",
+                                  "{'operation': 'x', 'data': {'score': Infinity}}",
+                                  "{'operation': 'x', 'data': {'score': -Infinity}}"])
+def test_parse_literal_is_literal_eval(text):
+    try:
+        expected = ast.literal_eval(text)
+    except ValueError: # json parses the bare words NaN and Infinity, python literals do not
+        with pytest.raises(ValueError):
+            Parser._parse_literal(text)
+        return
+    parsed = Parser._parse_literal(text)
+    assert parsed == expected
+    assert repr(parsed) == repr(expected) # lists and tuples are not equal, but check the types anyway
+
+@pytest.mark.parametrize("quote", ["'", '"'])
+def test_list_logical_operation_is_invalid_whatever_the_quotes(quote, tmp_path):
+    filepath = tmp_path / "scenario"
+    filepath.write_text("[{'operation': 'add_logical_operation', 'data': {'user_id': 'u1', "
+                        "'logical_operation': [QaQ, QbQ], 'score': 1.0}}]".replace("Q", quote))
+    with pytest.raises(AssertionError):
+        list(Parser.Parser().iter_file(str(filepath)))
+
+def execute(command_dicts, simulator=None):
+    simulator = Simulator.Simulator(seed=0) if simulator is None else simulator
+    for command in Parser.expand_commands(Parser.Parser().make_commands(command_dicts)):
+        command.execute(simulator)
+    return simulator
+
+def sessions(simulator):
+    return {user_id : user.session_id for user_id, user in simulator.users.items()}
+
+def test_add_users_from_prefix_and_count():
+    simulator = execute([{"operation" : "add_users",
+                          "data" : {"prefix" : "user_", "count" : 3, "start" : 5, "session_id" : "S{i}_x"}}])
+    assert sessions(simulator) == {"user_5" : "S5_x", "user_6" : "S6_x", "user_7" : "S7_x"}
+    assert list(simulator.users) == ["user_5", "user_6", "user_7"]
+
+def test_add_users_from_user_ids():
+    simulator = execute([{"operation" : "add_users", "data" : {"user_ids" : ["b", "a"], "session_id" : "S{i}"}},
+                         {"operation" : "add_users", "data" : {"user_ids" : ["c"]}}])
+    assert sessions(simulator) == {"b" : "S0", "a" : "S1", "c" : None}
+
+@pytest.mark.parametrize("users", [{"prefix" : "u"}, {"prefix" : "u", "count" : -1}, {"prefix" : "u", "count" : 2, "first" : 1},
+                                   {"user_ids" : ["a"], "count" : 1}, {"user_ids" : "a"}])
+def test_add_users_rejects_invalid_users(users):
+    with pytest.raises(AssertionError):
+        Parser.Parser().make_commands([{"operation" : "add_users", "data" : users}])
+
+def test_repeat_substitutes_the_iteration_number():
+    command_dicts = [{"operation" : "repeat",
+                      "data" : {"times" : 3, "start" : 1,
+                                "commands" : [{"operation" : "add_user", "data" : {"user_id" : "user_{i}"}},
+                                              {"operation" : "set_session", "data" : {"user_id" : "user_{i}", "session_id" : "S{i}{i}"}}]}}]
+    assert sessions(execute(command_dicts)) == {"user_1" : "S11", "user_2" : "S22", "user_3" : "S33"}
+
+def test_nested_repeats_with_their_own_vars():
+    inner = {"operation" : "repeat",
+             "data" : {"times" : 3, "var" : "t",
+                       "commands" : [{"operation" : "generate_text", "data" : {"user_id" : "user_{u}_{t}", "text_size" : 10}}]}}
+    outer = {"operation" : "repeat", "data" : {"times" : 2, "var" : "u", "commands" : [inner]}}
+    commands = list(Parser.expand_commands([Parser.Parser().make_command(outer)]))
+    assert [command.user_id for command in commands] == ["user_0_0", "user_0_1", "user_0_2", "user_1_0", "user_1_1", "user_1_2"]
+
+def test_repeat_is_expanded_one_iteration_at_a_time():
+    repeat = Parser.Parser().make_command({"operation" : "repeat",
+                                           "data" : {"times" : 10**12,
+                                                     "commands" : [{"operation" : "add_user", "data" : {"user_id" : "user_{i}"}}]}})
+    commands = Parser.expand_commands([repeat])
+    assert [command.user_id for command in itertools.islice(commands, 3)] == ["user_0", "user_1", "user_2"]
+
+def test_generate_population_command():
+    simulator = execute([{"operation" : "generate_population",
+                          "data" : {"users" : {"prefix" : "p", "count" : 4, "session_id" : "S{i}"},
+                                    "logical_operations" : [("a",), ("b", "c"), ("d",), ("e", "f", "g")],
+                                    "vocabulary_size" : 2, "text_size" : 7}}])
+    assert sessions(simulator) == {"p0" : "S0", "p1" : "S1", "p2" : "S2", "p3" : "S3"}
+    for user in simulator.users.values():
+        assert len(user.get_logical_operations()) == 2
+        assert [len(text) for text in user.texts_logical_operations] == [7]
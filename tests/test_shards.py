@@ -0,0 +1,28 @@
+import Executer
+import Parser
+import Shards
+from helpers import read_csv_outputs
+
+def users_scenario(filepath):
+    command_dicts = list()
+    for user_id, logical_operations in [("user_a", [("s1", "s2", "s3"), ("s4", "s5")]),
+                                        ("user_b", [("s4", "s5"), ("s6", "s7", "s8", "s9")])]:
+        command_dicts += [{"operation" : "add_user", "data" : {"user_id" : user_id}},
+                          {"operation" : "set_session", "data" : {"user_id" : user_id, "session_id" : "S_" + user_id}},
+                          {"operation" : "add_logical_operations",
+                           "data" : {"user_id" : user_id, "logical_operations" : logical_operations, "score" : 2.0}}]
+    command_dicts += [{"operation" : "generate_text", "data" : {"user_id" : "user_b", "text_size" : 300}},
+                      {"operation" : "generate_text", "data" : {"user_id" : "user_a", "text_size" : 200}},
+                      {"operation" : "generate_population",
+                       "data" : {"users" : {"prefix" : "pop_", "count" : 30, "session_id" : "S{i}"},
+                                 "logical_operations" : [["s{}".format(i), "s{}".format(i + 3)] for i in range(12)],
+                                 "vocabulary_size" : 5, "scores" : {"distribution" : "zipf", "a" : 1.2},
+                                 "text_size" : 40}}]
+    Parser.write_jsonl(command_dicts, filepath)
+
+def test_shards_match_per_user_streams(tmp_path):
+    scenario = str(tmp_path / "users.jsonl")
+    users_scenario(scenario)
+    Executer.Executer.execute(scenario, str(tmp_path / "streams"), seed=3, per_user_streams=True)
+    Shards.run_local(scenario, str(tmp_path / "shards"), 3, seed=3)
+    assert read_csv_outputs(str(tmp_path / "shards")) == read_csv_outputs(str(tmp_path / "streams"))
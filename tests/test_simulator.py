@@ -0,0 +1,95 @@
+import numpy as np
+import Simulator
+
+def test_iter_text_entries_yields_the_entries_generated_while_iterating():
+    for flush in [False, True]:
+        simulator = Simulator.Simulator(seed=0)
+        simulator.add_user("u1")
+        simulator.set_session("u1", "S1")
+        simulator.add_logical_operations_to_user("u1", [("a",), ("b", "c")], [1.0, 1.0])
+        simulator.generate_text_for_user("u1", 5)
+        yielded = 0
+        for text_entry in simulator.iter_text_entries(flush=flush):
+            yielded += 1
+            if yielded < 3:
+                simulator.generate_text_for_user("u1", 5)
+        assert yielded == 3
+        assert len(simulator.get_text_entries()) == (0 if flush else 3)
+
+def test_histogram_counts_the_generated_logical_operations():
+    import collections
+    simulator = Simulator.Simulator(seed=0)
+    for u in range(3):
+        simulator.add_user("u{}".format(u))
+        simulator.set_session("u{}".format(u), "S")
+        simulator.add_logical_operations_to_user("u{}".format(u), [("a",), ("b", "c"), ("d",), ("e", "f")][u:],
+                                                 [1.0, 2.0, 3.0, 4.0][u:])
+        for _ in range(3):
+            simulator.generate_text_for_user("u{}".format(u), 20)
+    histogram = simulator.get_histogram()
+    for user_id, user in simulator.users.items():
+        expected = collections.Counter(simulator.symbols.logical_operations[i]
+                                       for text in user.texts_logical_operations for i in text.tolist())
+        rows = histogram[histogram["user_id"] == user_id]
+        assert dict(zip(rows["logical_operation"], rows["cnt"])) == expected
+        assert abs(rows["percentage"].sum() - 1) < 1e-9
+
+def test_vocabulary_has_the_semantics_of_a_dict():
+    random_state = np.random.RandomState(0)
+    user = Simulator.User("u1")
+    expected = dict()
+    operations = [("s{}".format(i),) for i in range(40)]
+    for step in range(2000):
+        action = random_state.randint(4)
+        if action == 0:
+            lo, score = operations[random_state.randint(40)], float(random_state.randint(1, 9))
+            user.add_logical_operation(lo, score)
+            expected[lo] = score
+        elif action == 1:
+            lo = operations[random_state.randint(40)]
+            user.del_logical_operation(lo)
+            expected.pop(lo, None)
+        elif action == 2:
+            chosen = [operations[i] for i in random_state.randint(40, size=random_state.randint(1, 6))]
+            scores = random_state.randint(1, 9, size=len(chosen)).astype(float)
+            user.add_logical_operations(chosen, scores)
+            expected.update(zip(chosen, scores.tolist()))
+        else:
+            assert user.get_logical_operations() == list(expected)
+            assert user.vocabulary_scores.tolist() == list(expected.values())
+    assert user.get_logical_operations() == list(expected)
+
+TEMPLATE = [("a",), ("b", "c"), ("d",), ("e", "f", "g"), ("h",), ("i", "j")]
+
+def test_population_draws_the_vocabularies_from_the_template():
+    simulator = Simulator.Simulator(seed=0)
+    simulator.generate_population([("u{}".format(u), "S{}".format(u)) for u in range(20)], TEMPLATE, vocabulary_size=3,
+                                  scores={"distribution" : "zipf", "a" : 1.2})
+    vocabularies = set()
+    for user in simulator.users.values():
+        vocabulary = user.get_logical_operations()
+        assert len(set(vocabulary)) == 3 and set(vocabulary) <= set(TEMPLATE)
+        assert not user.texts
+        vocabularies.add(frozenset(vocabulary))
+    assert len(vocabularies) > 1
+
+def test_population_keeps_the_global_random_state():
+    np.random.seed(5)
+    expected = np.random.random_sample(3)
+    simulator = Simulator.Simulator(seed=5)
+    simulator.generate_population([("u{}".format(u), None) for u in range(10)], TEMPLATE, vocabulary_size=2)
+    assert np.array_equal(np.random.random_sample(3), expected)
+
+def test_population_skips_users_without_changing_the_others():
+    users = [("u{}".format(u), "S") for u in range(12)]
+    everyone = Simulator.Simulator(seed=0, per_user_streams=True)
+    everyone.generate_population(users, TEMPLATE, vocabulary_size=3, text_size=20)
+    some = Simulator.Simulator(seed=0, per_user_streams=True)
+    some.user_filter = lambda user_id: int(user_id[1:]) % 3 == 0
+    some.generate_population(users, TEMPLATE, vocabulary_size=3, text_size=20)
+    assert list(some.users) == ["u0", "u3", "u6", "u9"]
+    for user_id, user in some.users.items():
+        assert user.get_logical_operations() == everyone.users[user_id].get_logical_operations()
+        texts = [simulator.symbols.decode_logical_operations(simulator.users[user_id].texts_logical_operations[0]).tolist()
+                 for simulator in [some, everyone]]
+        assert texts[0] == texts[1]
@@ -0,0 +1,4 @@
+import Benchmark
+
+def test_startup_within_budgets():
+    assert Benchmark.check_startup() == []
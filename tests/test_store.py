@@ -0,0 +1,39 @@
+import os
+import pandas as pd
+import Executer
+import Simulator
+from helpers import read_csv_outputs
+
+SCENARIOS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scenarios")
+
+def make_simulator(store=None):
+    simulator = Simulator.Simulator(seed=0, store=store)
+    for u in range(2):
+        user_id = "user_{}".format(u)
+        simulator.add_user(user_id)
+        simulator.set_session(user_id, "S{}".format(u))
+        simulator.add_logical_operations_to_user(user_id, [("a", "b"), ("c",), ("d", "e", "f")], [1.0, 2.0, 3.0])
+        for _ in range(3):
+            simulator.generate_text_for_user(user_id, 40)
+    return simulator
+
+def test_stored_texts_keep_their_locations(tmp_path):
+    in_ram = make_simulator()
+    stored = make_simulator(store=str(tmp_path / "store"))
+    for user_id, user in in_ram.users.items():
+        stored_user = stored.users[user_id]
+        assert len(stored_user.locations) == len(user.locations) == 3
+        for (basic, full), (stored_basic, stored_full) in zip(user.locations, stored_user.locations):
+            pd.testing.assert_frame_equal(stored_basic, basic)
+            pd.testing.assert_frame_equal(stored_full, full)
+
+def test_data_make_with_a_store(tmp_path):
+    Executer.Data.make(make_simulator(), str(tmp_path / "in_ram"))
+    Executer.Data.make(make_simulator(store=str(tmp_path / "store")), str(tmp_path / "stored"))
+    assert read_csv_outputs(str(tmp_path / "stored")) == read_csv_outputs(str(tmp_path / "in_ram"))
+
+def test_execute_with_a_store(tmp_path):
+    scenario = os.path.join(SCENARIOS, "s2")
+    Executer.Executer.execute(scenario, str(tmp_path / "in_ram"))
+    Executer.Executer.execute(scenario, str(tmp_path / "stored"), store=str(tmp_path / "store"))
+    assert read_csv_outputs(str(tmp_path / "stored")) == read_csv_outputs(str(tmp_path / "in_ram"))
@@ -0,0 +1,15 @@
+import Simulator
+
+def draws(user_id, seed=0):
+    return Simulator.user_random_state(seed, user_id).random(4).tolist()
+
+def test_user_stream_is_reproducible():
+    assert draws("user_1") == draws("user_1")
+    assert draws("user_1") != draws("user_1", seed=1)
+
+def test_crc32_colliding_ids_get_distinct_streams():
+    # the two ids have the same crc32, the spawn key of the streams before it was a sha256
+    assert draws("a63njrnmz6tg") != draws("imkmsc1e3x31")
+
+def test_ids_of_different_types_get_distinct_streams():
+    assert draws(1) != draws("1")
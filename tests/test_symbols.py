@@ -0,0 +1,35 @@
+import numpy as np
+import Simulator
+
+def test_decoding_grows_with_the_symbols():
+    symbols = Simulator.SymbolTable()
+    random_state = np.random.RandomState(0)
+    views = list()
+    for step in range(50):
+        for _ in range(random_state.randint(0, 5)):
+            symbols.logical_operation_id(tuple("s{}".format(l) for l in random_state.randint(100, size=3)))
+        ids = np.arange(len(symbols.logical_operations))
+        assert symbols.decode_logical_operations(ids).tolist() == symbols.logical_operations
+        assert symbols.decode_letters(np.arange(len(symbols.letters))).tolist() == symbols.letters
+        views.append((symbols.decoding_array("logical_operations"), list(symbols.logical_operations)))
+
+    # the views taken earlier still hold the symbols of their time
+    for view, logical_operations in views:
+        assert view.tolist() == logical_operations
+
+def test_decode_keeps_tuples_as_cells():
+    symbols = Simulator.SymbolTable()
+    a, b = symbols.logical_operation_id(("a", "b")), symbols.logical_operation_id(("c",))
+    decoded = symbols.decode_logical_operations([b, a, a])
+    assert decoded.dtype == object and decoded.tolist() == [("c",), ("a", "b"), ("a", "b")]
+
+def test_arrays_grow_with_the_logical_operations():
+    symbols = Simulator.SymbolTable()
+    random_state = np.random.RandomState(1)
+    for _ in range(300):
+        length = random_state.randint(1, 6)
+        symbols.logical_operation_id(tuple("s{}".format(l) for l in random_state.randint(30, size=length)))
+        lengths, offsets, letters = symbols.get_arrays()
+        assert lengths.tolist() == [len(lo) for lo in symbols.logical_operations_letters]
+        assert all(letters[offset : offset + length].tolist() == list(lo)
+                   for offset, length, lo in zip(offsets, lengths, symbols.logical_operations_letters))
@@ -0,0 +1,91 @@
+import collections
+import numpy as np
+import Executer
+import Parser
+import Simulator
+
+A, B, C = ("a",), ("b", "b"), ("c", "c", "c")
+
+def make_user(scores, transitions):
+    """
+    :param scores: dict of logical operation to score
+    :param transitions: list of (from logical operation, to logical operation, score)
+    """
+    user = Simulator.User("u1")
+    user.add_logical_operations(list(scores), list(scores.values()))
+    for from_logical_operation, to_logical_operation, score in transitions:
+        user.add_transition(from_logical_operation, to_logical_operation, score)
+    return user
+
+def followers(user, size=20000, seed=0):
+    """
+    :return: dict of logical operation to the Counter of the logical operations drawn right after it
+    """
+    ids = user.get_sampler().sample(size, random_state=np.random.RandomState(seed))
+    logical_operations = user.symbols.decode_logical_operations(ids).tolist()
+    counts = collections.defaultdict(collections.Counter)
+    for previous, current in zip(logical_operations, logical_operations[1:]):
+        counts[previous][current] += 1
+    return counts
+
+def frequencies(counter):
+    total = sum(counter.values())
+    return {key : count / total for key, count in counter.items()}
+
+def test_transition_frequencies_follow_the_scores():
+    user = make_user({A : 1.0, B : 1.0, C : 1.0}, [(A, B, 1.0), (A, C, 3.0), (B, A, 1.0), (C, A, 1.0)])
+    assert isinstance(user.get_sampler(), Simulator.MarkovSampler)
+    counts = followers(user)
+    after_a = frequencies(counts[A])
+    assert set(after_a) == {B, C}
+    assert abs(after_a[C] - 0.75) < 0.02
+    assert set(counts[B]) == set(counts[C]) == {A}
+
+def test_logical_operation_without_transitions_is_followed_by_an_independent_draw():
+    user = make_user({A : 1.0, B : 1.0, C : 2.0}, [(A, B, 1.0)])
+    counts = followers(user)
+    assert set(counts[A]) == {B}
+    after_others = frequencies(counts[B] + counts[C])
+    for logical_operation, probability in [(A, 0.25), (B, 0.25), (C, 0.5)]:
+        assert abs(after_others[logical_operation] - probability) < 0.02
+
+def test_transitions_to_deleted_or_unknown_logical_operations_are_ignored():
+    user = make_user({A : 1.0, B : 1.0, C : 1.0}, [(A, B, 1.0), (A, C, 5.0), (A, ("unknown",), 5.0), (B, A, 1.0)])
+    user.del_logical_operation(C)
+    counts = followers(user)
+    assert set(counts) == {A, B}
+    assert set(counts[A]) == {B}
+
+def transitions_scenario(filepath, delete):
+    command_dicts = [{"operation" : "add_user", "data" : {"user_id" : "u1"}},
+                     {"operation" : "set_session", "data" : {"user_id" : "u1", "session_id" : "S1"}},
+                     {"operation" : "add_logical_operations", "data" : {"user_id" : "u1", "logical_operations" : [A, B, C], "score" : 1.0}},
+                     {"operation" : "add_transitions", "data" : {"user_id" : "u1", "transitions" : [(A, B, 1.0), (B, C, 2.0)]}}]
+    if delete:
+        command_dicts.append({"operation" : "delete_transitions", "data" : {"user_id" : "u1", "transitions" : [(A, B), (B, C)]}})
+    Parser.write_jsonl(command_dicts, filepath)
+    return command_dicts
+
+def test_transitions_jsonl_round_trip(tmp_path):
+    filepath = str(tmp_path / "transitions.jsonl")
+    command_dicts = transitions_scenario(filepath, delete=True)
+    assert list(Parser.iter_jsonl(filepath)) == command_dicts
+    commands = list(Parser.Parser().iter_file(filepath))
+    assert commands[3].transitions == [(A, B, 1.0), (B, C, 2.0)]
+    assert commands[4].transitions == [(A, B), (B, C)]
+
+def test_delete_transitions_goes_back_to_the_sampler(tmp_path):
+    filepath = str(tmp_path / "transitions.jsonl")
+    transitions_scenario(filepath, delete=False)
+    executer = Executer.Executer()
+    executer.execute_from_file(filepath)
+    assert isinstance(executer.simulator.users["u1"].get_sampler(), Simulator.MarkovSampler)
+
+    transitions_scenario(filepath, delete=True)
+    executer = Executer.Executer()
+    executer.execute_from_file(filepath)
+    user = executer.simulator.users["u1"]
+    assert not user.transitions
+    assert type(user.get_sampler()) is Simulator.Sampler
+    expected = Simulator.Sampler(user.vocabulary_ids.copy(), user.get_probabilities()).sample(100, np.random.RandomState(1))
+    assert np.array_equal(user.get_sampler().sample(100, np.random.RandomState(1)), expected)